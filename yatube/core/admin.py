@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import DeadJob, Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'task',
+        'priority',
+        'available_at',
+        'attempts',
+        'created')
+    list_filter = (
+        'task',)
+
+
+@admin.register(DeadJob)
+class DeadJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'task',
+        'attempts',
+        'failed')
+    list_filter = (
+        'task',)
+    actions = ('requeue',)
+
+    def requeue(self, request, queryset):
+        """Возвращает задачи в очередь с новым счётчиком попыток"""
+        for dead_job in queryset:
+            Job.objects.create(
+                task=dead_job.task,
+                payload=dead_job.payload,
+                priority=dead_job.priority,
+                available_at=timezone.now(),
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+            )
+        queryset.delete()
+    requeue.short_description = 'Вернуть в очередь'
@@ -0,0 +1,84 @@
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+from .metrics import metrics
+
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+EARLY_EXPIRATION_BETA = 1.0
+
+
+def _lock_key(key):
+    return f'lock:{key}'
+
+
+def _store(key, compute, timeout, stale_timeout):
+    """Вычисляет значение и кладёт его в кэш вместе со сроком свежести"""
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    if timeout is None:
+        cache.set(key, (value, None, delta), None)
+    else:
+        cache.set(key, (value, time.time() + timeout, delta),
+                  timeout + stale_timeout)
+    return value
+
+
+def _recompute(key, compute, timeout, stale_timeout):
+    """Пересчёт под уже захваченной блокировкой"""
+    try:
+        return _store(key, compute, timeout, stale_timeout)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _is_fresh(expires_at, delta, beta):
+    """Вероятностное досрочное устаревание (XFetch)
+    Чем ближе срок и дороже пересчёт, тем вероятнее, что один из
+    запросов обновит значение заранее, до массового промаха.
+    """
+    if expires_at is None:
+        return True
+    early = delta * beta * math.log(1 - random.random())
+    return time.time() - early < expires_at
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None,
+                   lock_timeout=LOCK_TIMEOUT, beta=EARLY_EXPIRATION_BETA,
+                   name='default'):
+    """Значение из кэша с защитой от одновременного пересчёта
+
+    Пересчитывает значение только тот запрос, который захватил
+    блокировку ключа. Остальные получают устаревшее значение, если оно
+    ещё хранится (stale_timeout секунд после timeout, по умолчанию столько
+    же, сколько timeout), или ждут результата пересчёта. Попадания и
+    промахи учитываются в метрике cache_requests_total с меткой name.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout or 0
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, expires_at, delta = envelope
+        if _is_fresh(expires_at, delta, beta):
+            metrics.inc('cache_requests_total', cache=name, result='hit')
+            return value
+        metrics.inc('cache_requests_total', cache=name, result='stale')
+        if cache.add(_lock_key(key), True, lock_timeout):
+            return _recompute(key, compute, timeout, stale_timeout)
+        return value
+    metrics.inc('cache_requests_total', cache=name, result='miss')
+    if cache.add(_lock_key(key), True, lock_timeout):
+        return _recompute(key, compute, timeout, stale_timeout)
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+        if cache.add(_lock_key(key), True, lock_timeout):
+            return _recompute(key, compute, timeout, stale_timeout)
+    return _store(key, compute, timeout, stale_timeout)
@@ -0,0 +1,197 @@
+import json
+import logging
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import DeadJob, Job
+
+logger = logging.getLogger(__name__)
+JOB_ORDERING = ('-priority', 'available_at', 'id')
+
+
+def task_path(func):
+    """Путь импорта функции задачи"""
+    path = f'{func.__module__}.{func.__qualname__}'
+    try:
+        imported = import_string(path)
+    except ImportError:
+        imported = None
+    if imported is not func:
+        raise ValueError(f'{path} не функция уровня модуля')
+    return path
+
+
+def enqueue(func, args=(), kwargs=None, priority=0, delay=0,
+            max_attempts=None):
+    """Ставит вызов func(*args, **kwargs) в очередь
+
+    Аргументы должны сериализоваться в JSON. Задача, поставленная
+    внутри транзакции, появится в очереди только вместе с её коммитом.
+    Задачи с большим priority выполняются раньше.
+    """
+    return Job.objects.create(
+        task=task_path(func),
+        payload=json.dumps({'args': list(args), 'kwargs': kwargs or {}}),
+        priority=priority,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """Задержка перед повтором: экспоненциальная с потолком"""
+    return min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+               settings.JOB_RETRY_DELAY_MAX)
+
+
+def claim_jobs(limit=1, task=None):
+    """Забирает до limit готовых задач, начиная с высокого приоритета
+    task ограничивает выборку задачами одной функции.
+
+    Условие available_at <= now в UPDATE не даёт двум воркерам забрать
+    одну задачу: второй не найдёт строку, которую первый уже сдвинул.
+    """
+    now = timezone.now()
+    ready = Job.objects.filter(available_at__lte=now)
+    if task is not None:
+        ready = ready.filter(task=task_path(task))
+    ready = list(ready.order_by(*JOB_ORDERING).values_list(
+        'id', flat=True)[:limit])
+    if not ready:
+        return []
+    lease = uuid.uuid4().hex
+    Job.objects.filter(id__in=ready, available_at__lte=now).update(
+        lease=lease,
+        attempts=F('attempts') + 1,
+        available_at=now + timedelta(
+            seconds=settings.JOB_VISIBILITY_TIMEOUT),
+    )
+    return list(Job.objects.filter(id__in=ready, lease=lease).order_by(
+        *JOB_ORDERING))
+
+
+def bury(job, error):
+    """Переносит задачу в таблицу отклонённых, если она ещё наша"""
+    with transaction.atomic():
+        if not Job.objects.filter(id=job.id, lease=job.lease).delete()[0]:
+            return
+        DeadJob.objects.create(
+            task=job.task,
+            payload=job.payload,
+            priority=job.priority,
+            attempts=job.attempts,
+            last_error=error,
+            created=job.created,
+        )
+    logger.error('Job %s %s failed after %s attempts', job.id, job.task,
+                 job.attempts)
+
+
+def complete_job(job):
+    """Удаляет выполненную задачу"""
+    Job.objects.filter(id=job.id, lease=job.lease).delete()
+
+
+def fail_job(job, error):
+    """Откладывает упавшую задачу на retry_delay
+    или после max_attempts попыток переносит её в DeadJob
+    """
+    logger.warning('Job %s %s failed\n%s', job.id, job.task, error)
+    if job.attempts >= job.max_attempts:
+        bury(job, error)
+        return
+    Job.objects.filter(id=job.id, lease=job.lease).update(
+        lease='',
+        last_error=error,
+        available_at=timezone.now() + timedelta(
+            seconds=retry_delay(job.attempts)),
+    )
+
+
+def expired(job):
+    """Задачу, чей воркер не уложился во время видимости, больше
+    не выполняем, если она исчерпала попытки
+    """
+    if job.attempts <= job.max_attempts:
+        return False
+    bury(job, job.last_error or 'Превышено время выполнения')
+    return True
+
+
+def run_job(job):
+    """Выполняет забранную задачу, возвращает успех выполнения"""
+    if expired(job):
+        return False
+    try:
+        payload = json.loads(job.payload)
+        import_string(job.task)(*payload['args'], **payload['kwargs'])
+    except Exception:
+        fail_job(job, traceback.format_exc())
+        return False
+    complete_job(job)
+    return True
+
+
+def work(stop=None, burst=True, batch_size=1, poll_interval=None):
+    """Цикл воркера: забирает и выполняет задачи в текущем потоке
+
+    В режиме burst возвращается, когда готовых задач не осталось
+    или очередь недоступна, иначе ждёт новые, опрашивая очередь,
+    пока не установлен stop.
+    Возвращает число выполненных задач.
+    """
+    stop = stop or threading.Event()
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    processed = 0
+    while not stop.is_set():
+        try:
+            jobs = claim_jobs(batch_size)
+        except DatabaseError:
+            logger.warning('Could not claim jobs', exc_info=True)
+            jobs = []
+        if not jobs:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        for job in jobs:
+            run_job(job)
+            processed += 1
+    return processed
+
+
+def work_in_thread(results, **options):
+    """work для потока пула: закрывает своё соединение с БД"""
+    try:
+        results.append(work(**options))
+    finally:
+        connection.close()
+
+
+def run_workers(workers, **options):
+    """Запускает workers потоков с циклом work и ждёт их завершения"""
+    stop = options.setdefault('stop', threading.Event())
+    results = []
+    threads = [
+        threading.Thread(target=work_in_thread, args=(results,),
+                         kwargs=options, name=f'jobs-{number}')
+        for number in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return sum(results)
@@ -0,0 +1,120 @@
+import base64
+import json
+import traceback
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .jobs import claim_jobs, complete_job, enqueue, expired, fail_job
+
+
+def message_payload(message):
+    """Письмо в виде словаря, который сериализуется в JSON"""
+    attachments = []
+    for attachment in message.attachments:
+        if not isinstance(attachment, tuple):
+            raise ValueError('Вложения MIMEBase не ставятся в очередь')
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append(
+            (filename, base64.b64encode(content).decode(), mimetype))
+    return {
+        'subject': str(message.subject),
+        'body': str(message.body),
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'attachments': attachments,
+        'content_subtype': message.content_subtype,
+    }
+
+
+def build_message(payload, connection=None):
+    """Письмо из словаря message_payload"""
+    payload = dict(payload)
+    alternatives = payload.pop('alternatives')
+    attachments = payload.pop('attachments')
+    content_subtype = payload.pop('content_subtype')
+    message = EmailMultiAlternatives(
+        connection=connection,
+        alternatives=[tuple(alternative) for alternative in alternatives],
+        **payload)
+    message.content_subtype = content_subtype
+    for filename, content, mimetype in attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def delivery_connection():
+    """Соединение бэкенда, который действительно отправляет письма"""
+    return get_connection(settings.EMAIL_DELIVERY_BACKEND)
+
+
+def deliver_message(payload):
+    """Задача очереди: отправляет одно письмо отдельным соединением
+    Так письма отправляет обычный воркер run_jobs.
+    """
+    build_message(payload, connection=delivery_connection()).send()
+
+
+def send_batch(connection, jobs):
+    """Отправляет письма забранных задач через открытое соединение
+    Письмо, которое не удалось отправить, откладывается на повтор.
+    """
+    sent = 0
+    for job in jobs:
+        if expired(job):
+            continue
+        try:
+            payload = json.loads(job.payload)['args'][0]
+            connection.send_messages([build_message(payload, connection)])
+        except Exception:
+            fail_job(job, traceback.format_exc())
+            continue
+        complete_job(job)
+        sent += 1
+    return sent
+
+
+def send_queued_mail(batch_size=None):
+    """Отправляет письма из очереди пачками по одному соединению
+    Соединение открывается, только если в очереди есть письма.
+    Возвращает число отправленных писем.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    jobs = claim_jobs(batch_size, task=deliver_message)
+    sent = 0
+    if not jobs:
+        return sent
+    with delivery_connection() as connection:
+        while jobs:
+            sent += send_batch(connection, jobs)
+            jobs = claim_jobs(batch_size, task=deliver_message)
+    return sent
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Бэкенд, который ставит письма в очередь и сразу возвращается
+
+    Отправляет их EMAIL_DELIVERY_BACKEND: пачками в manage.py
+    send_queued_mail или по одному в воркере run_jobs.
+    """
+
+    def send_messages(self, email_messages):
+        queued = 0
+        for message in email_messages:
+            try:
+                enqueue(deliver_message, args=(message_payload(message),),
+                        priority=settings.EMAIL_PRIORITY)
+            except Exception:
+                if not self.fail_silently:
+                    raise
+                continue
+            queued += 1
+        return queued
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.jobs import enqueue, run_workers
+from core.models import Job
+
+
+def noop(number):
+    """Пустая задача для замера накладных расходов очереди"""
+
+
+class Command(BaseCommand):
+    """Пропускная способность очереди задач"""
+    help = ('Ставит в очередь пустые задачи и замеряет, сколько задач '
+            'в секунду выполняют воркеры с разным числом потоков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000)
+        parser.add_argument('--workers', type=int, nargs='+',
+                            default=[1, 2, 4, 8])
+        parser.add_argument('--batch-size', type=int, nargs='+',
+                            default=[1, 10])
+
+    def handle(self, *args, **options):
+        if Job.objects.exists():
+            self.stderr.write('Очередь не пуста, замер исказится')
+            return
+        self.stdout.write(f'{"потоков":>8} {"пачка":>8} {"задач/с":>10}')
+        for workers in options['workers']:
+            for batch_size in options['batch_size']:
+                with transaction.atomic():
+                    for number in range(options['jobs']):
+                        enqueue(noop, args=(number,))
+                started = time.perf_counter()
+                processed = run_workers(workers, batch_size=batch_size)
+                rate = processed / (time.perf_counter() - started)
+                self.stdout.write(f'{workers:>8} {batch_size:>8} '
+                                  f'{rate:>10.0f}')
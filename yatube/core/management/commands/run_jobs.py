@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.jobs import run_workers
+
+
+class Command(BaseCommand):
+    """Воркер очереди отложенных задач"""
+    help = ('Выполняет задачи из очереди в пуле потоков. Несколько '
+            'таких процессов могут работать с одной очередью')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=settings.JOB_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Сколько задач поток забирает за раз')
+        parser.add_argument('--burst', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        processed = run_workers(options['workers'],
+                                burst=options['burst'],
+                                batch_size=options['batch_size'])
+        self.stdout.write(f'Выполнено задач: {processed}')
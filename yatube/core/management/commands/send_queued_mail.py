@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.mail import send_queued_mail
+
+
+class Command(BaseCommand):
+    """Отправка писем из очереди"""
+    help = ('Отправляет письма QueuedEmailBackend через '
+            'EMAIL_DELIVERY_BACKEND пачками по одному соединению')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.EMAIL_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Не завершаться, а ждать новые письма')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_mail(options['batch_size'])
+            if sent or not options['loop']:
+                self.stdout.write(f'Отправлено писем: {sent}')
+            if not options['loop']:
+                return
+            time.sleep(settings.JOB_POLL_INTERVAL)
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Ответы по представлениям и статусам', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Время ответа по представлениям', LATENCY_BUCKETS),
+    'db_queries_total': (
+        'counter', 'Запросы к БД по представлениям', None),
+    'cache_requests_total': (
+        'counter', 'Обращения к кэшу страниц и фрагментов', None),
+    'thumbnail_generation_seconds': (
+        'histogram', 'Время создания миниатюр и вариантов изображения',
+        LATENCY_BUCKETS),
+}
+
+
+def format_labels(labels, extra=()):
+    """Метки в формате {name="value",...}"""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs)
+    return f'{{{escaped}}}'
+
+
+def format_value(value):
+    """Число без лишних нулей, как в формате экспозиции Prometheus"""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Метрики процесса с выгрузкой в общий каталог
+
+    Значения копятся в памяти процесса. Если задан METRICS_DIR, процесс
+    не чаще METRICS_FLUSH_INTERVAL секунд атомарно переписывает свой
+    файл в нём, а /metrics суммирует файлы всех процессов. Счётчики и
+    гистограммы накопительные, поэтому сумма по процессам корректна.
+    """
+
+    def __init__(self):
+        self.start()
+        os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        """Пустые метрики и свой файл для нового процесса"""
+        self.lock = threading.Lock()
+        self.values = {}
+        self.flushed = 0.0
+        self.filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+    def reset(self):
+        """Обнуляет метрики процесса"""
+        with self.lock:
+            self.values = {}
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счётчик"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Добавляет наблюдение в гистограмму"""
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * (len(buckets) + 2))
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[position] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def flush(self, force=False):
+        """Записывает метрики процесса в его файл в METRICS_DIR"""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+                not force
+                and now - self.flushed < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed = now
+        with self.lock:
+            rows = [[name, labels, value]
+                    for (name, labels), value in self.values.items()]
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as output:
+            json.dump(rows, output)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Сумма метрик всех процессов"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            with self.lock:
+                return {key: (list(value) if isinstance(value, list)
+                              else value)
+                        for key, value in self.values.items()}
+        self.flush(force=True)
+        totals = {}
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            with open(path) as source:
+                rows = json.load(source)
+            for name, labels, value in rows:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merge(totals, key, value)
+        return totals
+
+    def exposition(self):
+        """Метрики в текстовом формате экспозиции Prometheus"""
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = sorted((labels, value)
+                            for (metric, labels), value in totals.items()
+                            if metric == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind == 'histogram':
+                    lines.extend(histogram_lines(name, labels, value,
+                                                 buckets))
+                else:
+                    lines.append(f'{name}{format_labels(labels)} '
+                                 f'{format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def merge(totals, key, value):
+    """Добавляет значение метрики одного процесса к сумме"""
+    if isinstance(value, list):
+        current = totals.setdefault(key, [0] * len(value))
+        for position, item in enumerate(value):
+            current[position] += item
+    else:
+        totals[key] = totals.get(key, 0) + value
+
+
+def histogram_lines(name, labels, counts, buckets):
+    """Строки _bucket, _sum и _count гистограммы"""
+    lines = []
+    for bound, count in zip(buckets, counts):
+        le = format_labels(labels, [('le', format_value(float(bound)))])
+        lines.append(f'{name}_bucket{le} {count}')
+    le = format_labels(labels, [('le', '+Inf')])
+    lines.append(f'{name}_bucket{le} {counts[-1]}')
+    lines.append(f'{name}_sum{format_labels(labels)} '
+                 f'{format_value(float(counts[-2]))}')
+    lines.append(f'{name}_count{format_labels(labels)} {counts[-1]}')
+    return lines
+
+
+metrics = Registry()
@@ -0,0 +1,102 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from .metrics import metrics
+from .queries import QueryRecorder
+
+logger = logging.getLogger(__name__)
+QUERY_STATS_HEADER = 'X-Query-Stats'
+
+
+class QueryInstrumentationMiddleware:
+    """Статистика запросов к БД для доли QUERY_SAMPLE_RATE запросов
+
+    Пишет в лог core.middleware JSON с числом запросов, временем в БД
+    и повторяющимися SQL. Если одинаковый SQL выполнился не меньше
+    QUERY_N_PLUS_ONE_THRESHOLD раз, запись уходит с уровнем WARNING
+    вместе с местом в шаблоне и коде, откуда пошли повторы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.QUERY_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = QueryRecorder(settings.QUERY_N_PLUS_ONE_THRESHOLD)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        repeated = recorder.repeated()
+        match = request.resolver_match
+        report = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_time_ms': round(recorder.time * 1000, 2),
+            'n_plus_one': repeated,
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO,
+                   json.dumps(report, ensure_ascii=False),
+                   extra={'queries': report})
+        if settings.QUERY_STATS_HEADER:
+            response[QUERY_STATS_HEADER] = (
+                f'count={recorder.count}; time={report["db_time_ms"]}ms; '
+                f'n_plus_one={len(repeated)}')
+        return response
+
+
+def view_label(request):
+    """Имя представления для меток метрик
+
+    Представления вне METRICS_NAMESPACES объединяются в 'other',
+    чтобы число рядов метрик оставалось ограниченным.
+    """
+    match = request.resolver_match
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'not_found'
+    if match.namespace not in settings.METRICS_NAMESPACES:
+        return 'other'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """Время ответа и число запросов к БД по представлениям"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        view = view_label(request)
+        metrics.observe('http_request_duration_seconds', elapsed, view=view)
+        metrics.inc('http_requests_total', view=view,
+                    method=request.method, status=str(response.status_code))
+        if queries[0]:
+            metrics.inc('db_queries_total', queries[0], view=view)
+        metrics.flush()
+        return response
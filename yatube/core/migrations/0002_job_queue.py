@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_stored_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=255, verbose_name='Функция')),
+                ('payload', models.TextField(verbose_name='Аргументы')),
+                ('priority', models.SmallIntegerField(verbose_name='Приоритет')),
+                ('attempts', models.PositiveSmallIntegerField(verbose_name='Попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created', models.DateTimeField(verbose_name='Дата создания')),
+                ('failed', models.DateTimeField(auto_now_add=True, verbose_name='Дата отказа')),
+            ],
+            options={
+                'verbose_name': 'Отклонённая задача',
+                'verbose_name_plural': 'Отклонённые задачи',
+                'ordering': ('-failed',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=255, verbose_name='Функция')),
+                ('payload', models.TextField(default='{}', verbose_name='Аргументы')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='Приоритет')),
+                ('available_at', models.DateTimeField(verbose_name='Доступна с')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(verbose_name='Максимум попыток')),
+                ('lease', models.CharField(blank=True, max_length=32, verbose_name='Метка воркера')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['-priority', 'available_at'], name='job_ready_idx'),
+        ),
+    ]
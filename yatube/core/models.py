@@ -0,0 +1,79 @@
+from django.db import models
+
+
+class StoredBlob(models.Model):
+    """Файл хранилища с адресацией по содержимому и число ссылок на него"""
+
+    name = models.CharField(max_length=255, primary_key=True,
+                            verbose_name='Путь в хранилище')
+    size = models.PositiveIntegerField(verbose_name='Размер, байт')
+    refs = models.PositiveIntegerField(default=0,
+                                       verbose_name='Количество ссылок')
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self) -> str:
+        """Возвращает путь файла"""
+        return self.name
+
+
+class Job(models.Model):
+    """Отложенная задача в очереди
+
+    Задача видна воркерам, когда наступило available_at. Взявший её
+    воркер сдвигает available_at на время видимости и записывает свой
+    lease: если воркер упадёт, задача снова станет видна другим.
+    """
+
+    task = models.CharField(max_length=255, verbose_name='Функция')
+    payload = models.TextField(default='{}', verbose_name='Аргументы')
+    priority = models.SmallIntegerField(default=0,
+                                        verbose_name='Приоритет')
+    available_at = models.DateTimeField(verbose_name='Доступна с')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток')
+    lease = models.CharField(max_length=32, blank=True,
+                             verbose_name='Метка воркера')
+    last_error = models.TextField(blank=True,
+                                  verbose_name='Последняя ошибка')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Дата создания')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-priority', 'available_at'],
+                         name='job_ready_idx'),
+        ]
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+
+    def __str__(self) -> str:
+        """Возвращает функцию задачи"""
+        return self.task
+
+
+class DeadJob(models.Model):
+    """Задача, исчерпавшая попытки"""
+
+    task = models.CharField(max_length=255, verbose_name='Функция')
+    payload = models.TextField(verbose_name='Аргументы')
+    priority = models.SmallIntegerField(verbose_name='Приоритет')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток')
+    last_error = models.TextField(blank=True,
+                                  verbose_name='Последняя ошибка')
+    created = models.DateTimeField(verbose_name='Дата создания')
+    failed = models.DateTimeField(auto_now_add=True,
+                                  verbose_name='Дата отказа')
+
+    class Meta:
+        ordering = ('-failed',)
+        verbose_name = 'Отклонённая задача'
+        verbose_name_plural = 'Отклонённые задачи'
+
+    def __str__(self) -> str:
+        """Возвращает функцию задачи"""
+        return self.task
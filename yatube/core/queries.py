@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+import time
+
+from django.conf import settings
+from django.template.base import Node
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+RENDER_CODE = Node.render_annotated.__code__
+SKIPPED_PATHS = (os.path.splitext(__file__)[0], 'site-packages')
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT',
+                          'ROLLBACK TO SAVEPOINT')
+
+
+def fingerprint(sql):
+    """SQL без различий в длине списков IN"""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def project_file(filename):
+    """Файл проекта, кроме инструментирования и библиотек"""
+    return filename.startswith(settings.BASE_DIR) and not any(
+        path in filename for path in SKIPPED_PATHS)
+
+
+def template_location(frame):
+    """Шаблон и строка узла, который рендерился в кадре"""
+    node = frame.f_locals.get('self')
+    origin = getattr(node, 'origin', None)
+    token = getattr(node, 'token', None)
+    if origin is None or token is None:
+        return None
+    return f'{origin.template_name or origin.name}:{token.lineno}'
+
+
+def query_location(frame):
+    """Ближайшие к запросу строка шаблона и строка кода проекта"""
+    template = code = None
+    while frame is not None and (template is None or code is None):
+        filename = frame.f_code.co_filename
+        if code is None and project_file(filename):
+            code = (f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                    f'{frame.f_lineno} in {frame.f_code.co_name}')
+        if template is None and frame.f_code is RENDER_CODE:
+            template = template_location(frame)
+        frame = frame.f_back
+    return {'template': template, 'code': code}
+
+
+class QueryRecorder:
+    """Обёртка выполнения запросов для connection.execute_wrapper
+
+    Считает запросы, время в БД и повторы одинакового SQL. Место в
+    шаблоне и коде ищется по стеку только один раз для каждого SQL,
+    повторившегося threshold раз, поэтому обычные запросы обходятся
+    в один замер времени и одну регулярку.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.time = 0.0
+        self.fingerprints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.time += elapsed
+            if not sql.startswith(TRANSACTION_STATEMENTS):
+                self.record(sql, elapsed)
+
+    def record(self, sql, elapsed):
+        """Учитывает повтор SQL, транзакционные команды не учитываются"""
+        stats = self.fingerprints.setdefault(
+            fingerprint(sql), {'count': 0, 'time': 0.0})
+        stats['count'] += 1
+        stats['time'] += elapsed
+        if stats['count'] == self.threshold:
+            stats.update(query_location(sys._getframe(2)))
+
+    def repeated(self):
+        """SQL, повторившиеся не меньше threshold раз: похоже на N+1"""
+        return [
+            {
+                'sql': sql,
+                'count': stats['count'],
+                'time_ms': round(stats['time'] * 1000, 2),
+                'template': stats['template'],
+                'code': stats['code'],
+            }
+            for sql, stats in sorted(self.fingerprints.items(),
+                                     key=lambda item: -item[1]['count'])
+            if stats['count'] >= self.threshold
+        ]
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredBlob
+
+HASH_NAME_RE = re.compile(
+    r'^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором путь файла - хэш его содержимого
+
+    Загрузка 'posts/photo.JPG' сохраняется как 'posts/ab/cd/<sha256>.jpg':
+    хэш считается при потоковой записи во временный файл, две первые пары
+    символов хэша разносят файлы по подкаталогам. Одинаковые файлы
+    хранятся один раз, StoredBlob считает ссылки на них, и файл
+    удаляется с последней ссылкой.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        """Имя определяется содержимым, суффиксы не нужны"""
+        return name
+
+    @staticmethod
+    def is_hashed_name(name):
+        """Сохранён ли файл уже по хэшу содержимого"""
+        return bool(HASH_NAME_RE.match(name))
+
+    def hashed_name(self, name, digest):
+        """'posts/a.JPG' -> 'posts/ab/cd/<digest>.jpg'"""
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return '/'.join(part for part in (
+            directory, digest[:2], digest[2:4], f'{digest}{extension}')
+            if part)
+
+    def _write_temporary(self, content):
+        """Пишет содержимое во временный файл, одновременно считая хэш"""
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.location, prefix='.upload-',
+                                         delete=False) as temporary:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                digest.update(chunk)
+                temporary.write(chunk)
+                size += len(chunk)
+        return temporary.name, digest.hexdigest(), size
+
+    def _place(self, temporary, path):
+        """Переносит временный файл на место, если такого файла ещё нет"""
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary, path)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+    def _save(self, name, content):
+        temporary, digest, size = self._write_temporary(content)
+        name = self.hashed_name(name, digest)
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.get_or_create(name=name,
+                                                 defaults={'size': size})
+                StoredBlob.objects.filter(name=name).update(
+                    refs=F('refs') + 1)
+            self._place(temporary, self.path(name))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return name
+
+    def delete(self, name):
+        """Снимает ссылку, файл удаляется вместе с последней
+
+        Файлы без записи StoredBlob, например загруженные до
+        перехода на это хранилище, не удаляются.
+        """
+        with transaction.atomic():
+            blobs = StoredBlob.objects.select_for_update().filter(name=name)
+            if not blobs.filter(refs__gt=1).update(refs=F('refs') - 1):
+                if not blobs.delete()[0]:
+                    return
+                super().delete(name)
@@ -0,0 +1,63 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.caching import get_or_compute
+from core.versions import get_versions
+
+register = template.Library()
+
+
+class VersionedCacheNode(template.Node):
+    """Фрагмент, ключ кэша которого включает версии областей"""
+
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, versions):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.versions = versions
+
+    def render(self, context):
+        try:
+            timeout = int(self.timeout.resolve(context))
+        except (ValueError, TypeError):
+            raise template.TemplateSyntaxError(
+                f'"versioned_cache" tag got a non-integer timeout value: '
+                f'{self.timeout.var!r}')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        versions = get_versions(
+            [var.resolve(context) for var in self.versions])
+        key = make_template_fragment_key(self.fragment_name,
+                                         vary_on + versions)
+        return get_or_compute(
+            key, lambda: self.nodelist.render(context), timeout,
+            name=self.fragment_name)
+
+
+@register.tag('versioned_cache')
+def do_versioned_cache(parser, token):
+    """Кэширует фрагмент до изменения версии любой из областей
+
+    {% versioned_cache 3600 index_page request.path versions 'posts' %}
+
+    Аргументы после versions - объекты моделей или строки областей,
+    их версии увеличиваются сигналами при записи.
+    """
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'"{tokens[0]}" tag requires at least 2 arguments.')
+    arguments = tokens[3:]
+    versions = []
+    if 'versions' in arguments:
+        split = arguments.index('versions')
+        arguments, versions = arguments[:split], arguments[split + 1:]
+    return VersionedCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(argument) for argument in arguments],
+        [parser.compile_filter(argument) for argument in versions],
+    )
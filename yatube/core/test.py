@@ -1,4 +1,51 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.template import engines
 from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from .caching import get_or_compute
+from .jobs import claim_jobs, enqueue, work
+from .mail import send_queued_mail
+from .metrics import metrics
+from .models import DeadJob, Job, StoredBlob
+from .queries import QueryRecorder
+from .storage import ContentAddressedStorage
+
+completed_jobs = []
+
+
+def record_job(name):
+    completed_jobs.append(name)
+
+
+def failing_job():
+    raise RuntimeError('Сбой задачи')
+
+
+class CountingEmailBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+
+class BrokenEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP недоступен')
 
 
 @override_settings(DEBUG=False)
@@ -13,3 +60,288 @@ class PostURLTests(TestCase):
         response = self.guest_client.get(non_exist_url)
         template = 'core/404.html'
         self.assertTemplateUsed(response, template)
+
+
+class GetOrComputeTests(TestCase):
+    """Тестирование защиты кэша от одновременного пересчёта"""
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def slow_compute(self):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return 'значение'
+
+    def run_concurrently(self, key, threads_count=10, **kwargs):
+        results = []
+        barrier = threading.Barrier(threads_count)
+
+        def worker():
+            barrier.wait()
+            results.append(get_or_compute(key, self.slow_compute, 60,
+                                          **kwargs))
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_recompute_on_miss(self):
+        """При одновременном промахе значение вычисляется один раз"""
+        results = self.run_concurrently('single_flight')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['значение'] * 10)
+
+    def test_stale_value_served_during_recompute(self):
+        """Пока значение пересчитывается, остальные получают устаревшее"""
+        cache.set('stale', ('старое', time.time() - 1, 0.0), 60)
+        results = self.run_concurrently('stale')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results.count('значение'), 1)
+        self.assertEqual(results.count('старое'), 9)
+
+    def test_early_expiration(self):
+        """Дорогое значение у конца срока пересчитывается заранее"""
+        cache.set('early', ('старое', time.time() + 1, 1000.0), 60)
+        self.assertEqual(get_or_compute('early', self.slow_compute, 60),
+                         'значение')
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Тестирование хранилища с адресацией по содержимому"""
+    def setUp(self):
+        self.location = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_sharded_hashed_name(self):
+        """Файл сохраняется по хэшу содержимого в подкаталогах"""
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'data'))
+        digest = ('3a6eb0790f39ac87c94f3856b2dd2c5d'
+                  '110e6811602261a9a923d3bb23adc8b7')
+        self.assertEqual(name, f'posts/3a/6e/{digest}.jpg')
+        self.assertTrue(self.storage.is_hashed_name(name))
+        self.assertFalse(self.storage.is_hashed_name('posts/Photo.JPG'))
+
+    def test_duplicates_stored_once(self):
+        """Одинаковые файлы хранятся один раз со счётчиком ссылок"""
+        first = self.storage.save('posts/a.gif', ContentFile(b'same'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'same'))
+        self.assertEqual(first, second)
+        self.assertEqual(StoredBlob.objects.get(name=first).refs, 2)
+        files = [name for _, _, names in os.walk(self.location)
+                 for name in names]
+        self.assertEqual(len(files), 1)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется вместе с последней ссылкой"""
+        name = self.storage.save('posts/a.gif', ContentFile(b'same'))
+        self.storage.save('posts/b.gif', ContentFile(b'same'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+
+    def test_unmanaged_file_kept(self):
+        """Файлы без счётчика ссылок не удаляются"""
+        path = os.path.join(self.location, 'posts', 'old.gif')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as old:
+            old.write(b'old')
+        self.storage.delete('posts/old.gif')
+        self.assertTrue(os.path.exists(path))
+
+
+class JobQueueTests(TestCase):
+    """Тестирование очереди отложенных задач"""
+    def setUp(self):
+        completed_jobs.clear()
+
+    def make_visible(self):
+        Job.objects.update(available_at=timezone.now())
+
+    def test_jobs_run_by_priority(self):
+        """Задачи выполняются по приоритету и удаляются"""
+        enqueue(record_job, args=('обычная',))
+        enqueue(record_job, args=('срочная',), priority=10)
+        enqueue(record_job, args=('отложенная',), delay=60)
+        self.assertEqual(work(), 2)
+        self.assertEqual(completed_jobs, ['срочная', 'обычная'])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_claimed_job_hidden_until_timeout(self):
+        """Забранная задача не видна другим до истечения времени"""
+        enqueue(record_job, args=('раз',))
+        self.assertEqual(len(claim_jobs()), 1)
+        self.assertEqual(claim_jobs(), [])
+        self.make_visible()
+        job, = claim_jobs()
+        self.assertEqual(job.attempts, 2)
+
+    def test_failed_job_retried_then_buried(self):
+        """Упавшая задача откладывается, а затем уходит в DeadJob"""
+        enqueue(failing_job, max_attempts=2)
+        work()
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.available_at,
+                           timezone.now() + timedelta(seconds=5))
+        self.make_visible()
+        work()
+        self.assertFalse(Job.objects.exists())
+        dead_job = DeadJob.objects.get()
+        self.assertEqual(dead_job.attempts, 2)
+        self.assertIn('Сбой задачи', dead_job.last_error)
+
+    def test_only_module_functions(self):
+        """В очередь ставятся только функции уровня модуля"""
+        with self.assertRaises(ValueError):
+            enqueue(lambda: None)
+
+
+@override_settings(EMAIL_BACKEND='core.mail.QueuedEmailBackend',
+                   EMAIL_DELIVERY_BACKEND='core.test.CountingEmailBackend',
+                   EMAIL_BATCH_SIZE=2)
+class QueuedEmailTests(TestCase):
+    """Тестирование очереди исходящих писем"""
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+
+    def send(self, count):
+        for number in range(count):
+            message = mail.EmailMultiAlternatives(
+                f'Письмо {number}', 'Текст', 'yatube@example.com',
+                ['user@example.com'])
+            message.attach_alternative('<p>Текст</p>', 'text/html')
+            message.send()
+
+    def test_mail_queued_and_sent_in_batches(self):
+        """Письма ждут в очереди и уходят через одно соединение"""
+        self.send(5)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Job.objects.count(), 5)
+        self.assertEqual(send_queued_mail(), 5)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         [f'Письмо {number}' for number in range(5)])
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [('<p>Текст</p>', 'text/html')])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_mail_retried(self):
+        """Неотправленное письмо остаётся в очереди на повтор"""
+        self.send(1)
+        with self.settings(
+                EMAIL_DELIVERY_BACKEND='core.test.BrokenEmailBackend'):
+            self.assertEqual(send_queued_mail(), 0)
+        job = Job.objects.get()
+        self.assertIn('SMTP недоступен', job.last_error)
+        Job.objects.update(available_at=timezone.now())
+        self.assertEqual(send_queued_mail(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class QueryInstrumentationTests(TestCase):
+    """Тестирование статистики запросов"""
+    def setUp(self):
+        cache.clear()
+
+    def test_n_plus_one_located_in_template(self):
+        """Повторы SQL в цикле шаблона находятся с местом в шаблоне"""
+        for number in range(3):
+            StoredBlob.objects.create(name=f'blob{number}', size=number)
+        template = engines['django'].from_string(
+            '{% for blob in blobs %}\n'
+            '{{ blob.name }} {{ blob.size }}\n'
+            '{% endfor %}')
+        blobs = StoredBlob.objects.only('name')
+        recorder = QueryRecorder(threshold=3)
+        with connection.execute_wrapper(recorder):
+            template.render({'blobs': blobs})
+        self.assertEqual(recorder.count, 4)
+        repeated, = recorder.repeated()
+        self.assertEqual(repeated['count'], 3)
+        self.assertEqual(repeated['template'], '<unknown source>:2')
+        self.assertIn('core/test.py', repeated['code'])
+
+    @override_settings(QUERY_SAMPLE_RATE=1, QUERY_STATS_HEADER=True)
+    def test_stats_logged_and_sent_in_header(self):
+        """Статистика уходит в лог и в заголовок ответа"""
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            response = Client().get('/')
+        self.assertIn('"view": "posts:index"', logs.output[0])
+        self.assertRegex(response['X-Query-Stats'],
+                         r'^count=\d+; time=[\d.]+ms; n_plus_one=0$')
+
+    @override_settings(QUERY_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Вне выборки статистика не собирается"""
+        response = Client().get('/')
+        self.assertFalse(response.has_header('X-Query-Stats'))
+
+
+@override_settings(METRICS_TOKEN='metrics-token', METRICS_ALLOWED_IPS=[])
+class MetricsTests(TestCase):
+    """Тестирование метрик /metrics"""
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.scraper = Client(HTTP_AUTHORIZATION='Bearer metrics-token')
+
+    def test_anonymous_refused(self):
+        """Без токена и с чужого адреса метрики не отдаются"""
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        response = Client(HTTP_AUTHORIZATION='Bearer wrong').get('/metrics')
+        self.assertEqual(response.status_code, 403)
+        with self.settings(METRICS_TOKEN=None):
+            response = Client(HTTP_AUTHORIZATION='Bearer ').get('/metrics')
+            self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_address(self):
+        """Адрес из METRICS_ALLOWED_IPS получает метрики без токена"""
+        self.assertEqual(Client().get('/metrics').status_code, 200)
+        response = Client(REMOTE_ADDR='10.0.0.1').get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_latency_and_cache_metrics(self):
+        """Ответы, время и обращения к кэшу попадают в экспозицию"""
+        Client().get('/')
+        Client().get('/')
+        response = self.scraper.get('/metrics')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram',
+                      text)
+        self.assertIn('http_requests_total{method="GET",status="200",'
+                      'view="posts:index"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket'
+                      '{view="posts:index",le="+Inf"} 2', text)
+        self.assertIn('cache_requests_total{cache="page",result="hit"} 1',
+                      text)
+        self.assertIn('cache_requests_total{cache="page",result="miss"} 1',
+                      text)
+
+    def test_processes_aggregated(self):
+        """Метрики процессов из METRICS_DIR суммируются"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        labels = [['method', 'GET'], ['status', '200'],
+                  ['view', 'posts:index']]
+        with open(os.path.join(directory, '1-1.json'), 'w') as other:
+            json.dump([['http_requests_total', labels, 4]], other)
+        with self.settings(METRICS_DIR=directory):
+            Client().get('/')
+            text = self.scraper.get('/metrics').content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",'
+                      'view="posts:index"} 5', text)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Model
+
+VERSION_KEY_PREFIX = 'version'
+
+
+def version_scope(value):
+    """Имя области версий: для объекта модели '<модель>:<pk>'"""
+    if isinstance(value, Model):
+        return f'{value._meta.model_name}:{value.pk}'
+    return str(value)
+
+
+def _version_key(scope):
+    return f'{VERSION_KEY_PREFIX}:{scope}'
+
+
+def _initial_version():
+    """Начальная версия не совпадает с вытесненными из кэша старыми"""
+    return time.time_ns() // 1000
+
+
+def get_versions(scopes):
+    """Текущие версии областей одним обращением к кэшу"""
+    keys = [_version_key(version_scope(scope)) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            initial = _initial_version()
+            cache.add(key, initial, None)
+            versions[key] = cache.get(key, initial)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    """Увеличивает версии областей, делая устаревшими их фрагменты
+    Возвращает новые версии в порядке областей.
+    """
+    versions = []
+    for scope in scopes:
+        key = _version_key(version_scope(scope))
+        try:
+            versions.append(cache.incr(key))
+        except ValueError:
+            versions.append(_initial_version())
+            cache.set(key, versions[-1], None)
+    return versions
@@ -1,7 +1,13 @@
+import hmac
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from .metrics import metrics
+
 
 def page_not_found(request, exception):
     """Страница ошибки 404"""
@@ -23,3 +29,23 @@ def permission_denied(request, exception):
 def csrf_failure(request, reason=''):
     """Страница ошибки токена 403"""
     return render(request, 'core/403csrf.html', status=HTTPStatus.FORBIDDEN)
+
+
+def metrics_allowed(request):
+    """Пришёл ли запрос с адреса METRICS_ALLOWED_IPS или с METRICS_TOKEN"""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    """Метрики всех процессов в формате экспозиции Prometheus
+    Доступны только по metrics_allowed, остальным ответ 403.
+    """
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.exposition(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
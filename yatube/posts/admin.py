@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import match_expression, matching_posts
 
 
 @admin.register(Post)
@@ -20,6 +21,13 @@ class PostAdmin(admin.ModelAdmin):
         'pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту через полнотекстовый индекс вместо LIKE"""
+        if not match_expression(search_term):
+            return super().get_search_results(
+                request, queryset, search_term)
+        return matching_posts(queryset, search_term), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,274 @@
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+
+from core.versions import bump_versions, get_versions
+
+from .models import Group
+from .utils import in_memory_database
+
+User = get_user_model()
+AUTOCOMPLETE_SCOPE = 'autocomplete'
+AUTOCOMPLETE_LIMIT = 10
+# Поиск подстроки проверяет не больше TRIGRAM_SCAN_LIMIT записей из самого
+# короткого списка триграммы запроса. Совпадения за его пределами
+# теряются, поэтому короткие запросы из частых триграмм находят подстроку
+# не во всех записях. Поиск по префиксу этим числом не ограничен.
+TRIGRAM_SCAN_LIMIT = 500
+# Изменения индекса хранятся в кэше под версиями AUTOCOMPLETE_SCOPE,
+# другие процессы применяют их без перестройки. Если процесс отстал больше
+# чем на CHANGELOG_SIZE изменений или изменение не появилось в кэше за
+# CHANGE_WAIT секунд, индекс перестраивается из БД.
+CHANGELOG_SIZE = 1000
+CHANGE_TIMEOUT = 60 * 60
+CHANGE_WAIT = 5
+TERM_SEPARATOR = '\x00'
+
+Entry = namedtuple('Entry', 'kind key label terms')
+
+
+def normalize(value):
+    """Строка для сравнения без учёта регистра и формы символов"""
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    return ' '.join(value.replace(TERM_SEPARATOR, '').split())
+
+
+def change_key(version):
+    """Ключ кэша изменения индекса с версией version"""
+    return f'{AUTOCOMPLETE_SCOPE}:change:{version}'
+
+
+def trigrams(term):
+    """Множество триграмм строки"""
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def user_entry(user_id, username, first_name, last_name):
+    """Запись индекса для пользователя, id записи чётный"""
+    full_name = f'{first_name} {last_name}'.strip()
+    terms = {normalize(value)
+             for value in (username, first_name, last_name, full_name)}
+    terms.discard('')
+    return user_id * 2, Entry('user', username, full_name or username,
+                              tuple(terms))
+
+
+def group_entry(group_id, slug, title):
+    """Запись индекса для сообщества, id записи нечётный"""
+    terms = {normalize(slug), normalize(title)}
+    terms.update(normalize(title).split())
+    terms.discard('')
+    return group_id * 2 + 1, Entry('group', slug, title, tuple(terms))
+
+
+class AutocompleteIndex:
+    """Индекс имён пользователей и сообществ в памяти процесса
+
+    Отсортированный список строк '<термин>\\0<id записи>' отвечает на
+    поиск по префиксу двоичным поиском, триграммы - на поиск подстроки.
+    Сигналы меняют индекс своего процесса на месте, увеличивают версию
+    AUTOCOMPLETE_SCOPE и кладут изменение в кэш под новой версией.
+    Процесс, увидевший чужие версии, применяет их изменения по порядку.
+    Индекс строится при первом поиске и перестраивается в фоновом потоке,
+    до его готовности поиск отвечает по старому индексу или пустым
+    списком. Поток не запускается при импорте: сервер, который форкает
+    воркеры после загрузки приложения, иначе получил бы в них
+    недогруженные модули. С БД SQLite в памяти, которую нельзя делить
+    между потоками, индекс строится сразу.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.builder = None
+        self.missing_since = None
+        self.terms = []
+        self.entries = {}
+        self.trigrams = {}
+
+    def reset(self):
+        """Сбрасывает индекс, следующий поиск построит его заново"""
+        self.wait()
+        with self.lock:
+            self.version = self.missing_since = None
+            self.terms, self.entries, self.trigrams = [], {}, {}
+
+    def build(self):
+        """Строит индекс из БД и подменяет им текущий"""
+        version, = get_versions([AUTOCOMPLETE_SCOPE])
+        entries = dict(user_entry(*row) for row in User.objects.values_list(
+            'pk', 'username', 'first_name', 'last_name').iterator())
+        entries.update(group_entry(*row) for row in Group.objects.values_list(
+            'pk', 'slug', 'title').iterator())
+        terms = []
+        postings = defaultdict(lambda: array('q'))
+        for entry_id, entry in entries.items():
+            grams = set()
+            for term in entry.terms:
+                terms.append(f'{term}{TERM_SEPARATOR}{entry_id}')
+                grams |= trigrams(term)
+            for gram in grams:
+                postings[gram].append(entry_id)
+        terms.sort()
+        with self.lock:
+            self.terms, self.entries = terms, entries
+            self.trigrams = dict(postings)
+            self.version, self.missing_since = version, None
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        finally:
+            connection.close()
+
+    def rebuild(self):
+        """Перестраивает индекс в фоновом потоке, если он ещё не идёт"""
+        if in_memory_database():
+            self.build()
+            return
+        with self.lock:
+            if self.builder is not None and self.builder.is_alive():
+                return
+            self.builder = threading.Thread(
+                target=self._build_in_background, name='autocomplete',
+                daemon=True)
+            self.builder.start()
+
+    def wait(self, timeout=None):
+        """Ждёт окончания фоновой перестройки"""
+        builder = self.builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def replay(self, current):
+        """Применяет изменения версий после текущей до current
+
+        Останавливается на первом изменении, которого ещё нет в кэше.
+        Возвращает False, если индекс придётся перестроить из БД.
+        """
+        with self.lock:
+            if not 0 < current - self.version <= CHANGELOG_SIZE:
+                return False
+            versions = range(self.version + 1, current + 1)
+            changes = cache.get_many([change_key(version)
+                                      for version in versions])
+            for version in versions:
+                change = changes.get(change_key(version))
+                if change is None:
+                    break
+                self._replace(*change)
+                self.version = version
+            if self.version == current:
+                self.missing_since = None
+                return True
+            if self.missing_since is None:
+                self.missing_since = time.monotonic()
+            return time.monotonic() - self.missing_since < CHANGE_WAIT
+
+    def sync(self):
+        """Начинает строить индекс при первом обращении и догоняет версию"""
+        if self.version is None:
+            self.rebuild()
+            return
+        current, = get_versions([AUTOCOMPLETE_SCOPE])
+        if current != self.version and not self.replay(current):
+            self.rebuild()
+
+    def _add(self, entry_id, entry):
+        self.entries[entry_id] = entry
+        for term in entry.terms:
+            insort(self.terms, f'{term}{TERM_SEPARATOR}{entry_id}')
+            for gram in trigrams(term):
+                self.trigrams.setdefault(gram, array('q')).append(entry_id)
+
+    def _remove(self, entry_id):
+        """Удаляет термины записи, триграммы проверяются при поиске"""
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for term in entry.terms:
+            key = f'{term}{TERM_SEPARATOR}{entry_id}'
+            position = bisect_left(self.terms, key)
+            if position < len(self.terms) and self.terms[position] == key:
+                del self.terms[position]
+
+    def _replace(self, entry_id, entry):
+        self._remove(entry_id)
+        if entry is not None:
+            self._add(entry_id, entry)
+
+    def apply(self, entry_id, entry=None):
+        """Заменяет или удаляет запись и публикует изменение
+
+        Изменение кладётся в кэш под новой версией индекса, чтобы другие
+        процессы применили его в replay.
+        """
+        with self.lock:
+            if (self.version is not None
+                    and self.entries.get(entry_id) == entry):
+                return
+            version, = bump_versions(AUTOCOMPLETE_SCOPE)
+            cache.set(change_key(version), (entry_id, entry),
+                      CHANGE_TIMEOUT)
+            if self.version is not None:
+                self._replace(entry_id, entry)
+                if self.version == version - 1:
+                    self.version = version
+
+    def _prefix_matches(self, query, found, limit):
+        position = bisect_left(self.terms, query)
+        while position < len(self.terms) and len(found) < limit:
+            term, _, entry_id = self.terms[position].rpartition(
+                TERM_SEPARATOR)
+            if not term.startswith(query):
+                return
+            found.setdefault(int(entry_id), None)
+            position += 1
+
+    def _trigram_matches(self, query, found, limit):
+        grams = trigrams(query)
+        postings = [self.trigrams.get(gram, ()) for gram in grams]
+        if not postings:
+            return
+        for entry_id in islice(min(postings, key=len), TRIGRAM_SCAN_LIMIT):
+            entry = self.entries.get(entry_id)
+            if entry is not None and any(query in term
+                                         for term in entry.terms):
+                found.setdefault(entry_id, None)
+                if len(found) >= limit:
+                    return
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """Записи, термины которых начинаются с query или содержат его"""
+        query = normalize(query)
+        if not query:
+            return []
+        self.sync()
+        found = {}
+        with self.lock:
+            self._prefix_matches(query, found, limit)
+            if len(found) < limit and len(query) >= 3:
+                self._trigram_matches(query, found, limit)
+            return [self.entries[entry_id] for entry_id in found]
+
+    def update_user(self, user, deleted=False):
+        """Переиндексирует пользователя после сохранения или удаления"""
+        entry_id, entry = user_entry(user.pk, user.username,
+                                     user.first_name, user.last_name)
+        self.apply(entry_id, None if deleted else entry)
+
+    def update_group(self, group, deleted=False):
+        """Переиндексирует сообщество после сохранения или удаления"""
+        entry_id, entry = group_entry(group.pk, group.slug, group.title)
+        self.apply(entry_id, None if deleted else entry)
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,49 @@
+import math
+import time
+
+from PIL import Image, ImageFilter, ImageOps
+
+from .models import Group, Post, UserStats
+
+BENCH_AUTHORS = 1000
+
+
+def measure(func, repeat):
+    """Лучшее время из repeat запусков в миллисекундах"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def sample_image(width=2400, height=1600):
+    """Изображение с шумом и градиентом, похожее на фотографию"""
+    noise = Image.effect_noise((width, height), 64).filter(
+        ImageFilter.GaussianBlur(2))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    return Image.merge('RGB', (noise, gradient, ImageOps.invert(noise)))
+
+
+def bench_sample():
+    """Объекты для замеров представлений
+
+    Самый активный автор, самое крупное сообщество, пост с наибольшим
+    числом комментариев и пользователь с наибольшим числом подписок.
+    """
+    return {
+        'author': UserStats.objects.select_related('user').order_by(
+            '-posts_count').first().user,
+        'group': Group.objects.order_by('-posts_count').first(),
+        'post': Post.objects.order_by('-comments_count').first(),
+        'reader': UserStats.objects.select_related('user').order_by(
+            '-following_count').first().user,
+    }
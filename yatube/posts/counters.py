@@ -0,0 +1,121 @@
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _increments(deltas):
+    """Выражения F() для атомарного изменения счётчиков"""
+    return {name: Greatest(F(name) + delta, Value(0))
+            for name, delta in deltas.items()}
+
+
+def bump_user_stats(user_id, **deltas):
+    """Меняет счётчики пользователя, при необходимости создаёт их"""
+    stats = UserStats.objects.filter(user_id=user_id)
+    if stats.update(**_increments(deltas)) or min(deltas.values()) < 0:
+        return
+    UserStats.objects.get_or_create(user_id=user_id)
+    stats.update(**_increments(deltas))
+
+
+def bump_group_posts(group_id, delta):
+    """Меняет счётчик постов сообщества"""
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            **_increments({'posts_count': delta}))
+
+
+def bump_post_comments(post_id, delta):
+    """Меняет счётчик комментариев поста"""
+    Post.objects.filter(pk=post_id).update(
+        **_increments({'comments_count': delta}))
+
+
+def _count(model, field):
+    """Подзапрос количества объектов model, ссылающихся на строку"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')), 0)
+
+
+def _reconcile(queryset, counters, batch_size):
+    """Пересчитывает счётчики пачками по первичному ключу
+    Возвращает количество исправленных строк.
+    """
+    repaired = 0
+    last_pk = None
+    queryset = queryset.order_by('pk')
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return repaired
+        last_pk = pks[-1]
+        rows = queryset.filter(pk__in=pks).annotate(**{
+            f'real_{name}': expression
+            for name, expression in counters.items()})
+        drifted = []
+        for row in rows:
+            values = {name: getattr(row, f'real_{name}')
+                      for name in counters}
+            if any(getattr(row, name) != value
+                   for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(row, name, value)
+                drifted.append(row)
+        queryset.model.objects.bulk_update(drifted, list(counters))
+        repaired += len(drifted)
+
+
+def _create_missing_stats(batch_size):
+    """Создаёт нулевые счётчики пользователям, у которых их нет"""
+    missing = [UserStats(user_id=pk) for pk in User.objects.filter(
+        stats__isnull=True).values_list('pk', flat=True).iterator()]
+    insert_limit = connection.ops.bulk_batch_size(
+        [UserStats._meta.get_field('user')], missing)
+    UserStats.objects.bulk_create(
+        missing, batch_size=max(min(batch_size, insert_limit), 1),
+        ignore_conflicts=True)
+
+
+def recount_counters():
+    """Пересчитывает все счётчики одним UPDATE на таблицу
+
+    В отличие от reconcile_counters держит блокировку на всё время
+    пересчёта, зато не читает строки в Python. Подходит для только что
+    загруженных данных.
+    """
+    _create_missing_stats(RECONCILE_BATCH_SIZE)
+    Post.objects.filter(pk__in=Comment.objects.values('post')).update(
+        comments_count=_count(Comment, 'post'))
+    Group.objects.update(posts_count=_count(Post, 'group'))
+    UserStats.objects.update(
+        posts_count=_count(Post, 'author'),
+        followers_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'))
+
+
+def reconcile_counters(batch_size=RECONCILE_BATCH_SIZE):
+    """Сверяет все денормализованные счётчики с данными
+    Возвращает словарь с количеством исправленных строк по моделям.
+    """
+    _create_missing_stats(batch_size)
+    return {
+        'posts': _reconcile(Post.objects.all(), {
+            'comments_count': _count(Comment, 'post'),
+        }, batch_size),
+        'groups': _reconcile(Group.objects.all(), {
+            'posts_count': _count(Post, 'group'),
+        }, batch_size),
+        'users': _reconcile(UserStats.objects.all(), {
+            'posts_count': _count(Post, 'author'),
+            'followers_count': _count(Follow, 'author'),
+            'following_count': _count(Follow, 'user'),
+        }, batch_size),
+    }
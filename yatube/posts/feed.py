@@ -0,0 +1,101 @@
+from django.conf import settings
+
+from core.jobs import enqueue
+from core.versions import bump_versions
+
+from .models import FeedItem, Follow, Post
+from .utils import invalidate_counts
+
+FEED_ORDERING = ('-pub_date', '-post_id')
+FEED_BATCH_SIZE = 500
+
+
+def _feed_items(user_ids, posts):
+    """Создаёт записи лент, уже существующие пропускает
+    Версии user:<id> читателей увеличиваются, чтобы кэш их лент
+    обновился и тогда, когда пост раскладывает задача после публикации.
+    """
+    items = [FeedItem(user_id=user_id, post_id=post.id,
+                      author_id=post.author_id, pub_date=post.pub_date)
+             for user_id in user_ids for post in posts]
+    if not items:
+        return
+    FeedItem.objects.bulk_create(items, batch_size=FEED_BATCH_SIZE,
+                                 ignore_conflicts=True)
+    invalidate_counts(*[f'feed:{user_id}' for user_id in user_ids])
+    bump_versions(*[f'user:{user_id}' for user_id in user_ids])
+
+
+def follower_batch(author_id, after=0):
+    """Очередная пачка подписчиков автора по возрастанию id"""
+    return list(Follow.objects.filter(
+        author_id=author_id, user_id__gt=after).order_by(
+            'user_id').values_list('user_id', flat=True)[:FEED_BATCH_SIZE])
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора
+
+    Посты популярных авторов раскладывает очередь задач, см.
+    fan_out_batch, чтобы публикация не ждала записи во все ленты.
+    Записей в БД от этого не меньше, одна на подписчика, но чтение
+    ленты остаётся выборкой из одной таблицы без записи. Такие посты
+    попадают в ленты только при работающем manage.py run_jobs.
+    """
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)[
+            :limit + 1])
+    if len(followers) > limit:
+        enqueue(fan_out_batch, args=(post.id,))
+        return
+    _feed_items(followers, [post])
+
+
+def fan_out_batch(post_id, after=0):
+    """Задача: раскладывает пост по лентам пачки подписчиков с id
+    больше after и ставит в очередь следующую пачку."""
+    post = Post.objects.filter(pk=post_id).only(
+        'id', 'author_id', 'pub_date').first()
+    if post is None:
+        return
+    followers = follower_batch(post.author_id, after)
+    _feed_items(followers, [post])
+    if len(followers) == FEED_BATCH_SIZE:
+        enqueue(fan_out_batch, args=(post_id, followers[-1]))
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки"""
+    posts = Post.objects.filter(author_id=author_id).only(
+        'id', 'author_id', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    _feed_items([user_id], posts)
+
+
+def clear_feed(user_id, author_id):
+    """Убирает из ленты посты автора после отписки"""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+    invalidate_counts(f'feed:{user_id}')
+
+
+def forget_post(post):
+    """Сбрасывает количества в лентах, где был удалённый пост
+    Первая пачка подписчиков обрабатывается сразу, остальные - в
+    очереди задач, см. forget_post_batch.
+    """
+    forget_post_batch(post.author_id)
+
+
+def forget_post_batch(author_id, after=0):
+    """Задача: сбрасывает количества в лентах пачки подписчиков
+    с id больше after и ставит в очередь следующую пачку."""
+    followers = follower_batch(author_id, after)
+    invalidate_counts(*[f'feed:{user_id}' for user_id in followers])
+    if len(followers) == FEED_BATCH_SIZE:
+        enqueue(forget_post_batch, args=(author_id, followers[-1]))
+
+
+def feed_queryset(user):
+    """Лента подписок пользователя: выборка по индексу одной таблицы"""
+    return FeedItem.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
@@ -1,5 +1,6 @@
 from django import forms
 
+from .images import normalize_upload
 from .models import Comment, Post
 
 
@@ -18,6 +19,13 @@ class PostForm(forms.ModelForm):
             raise forms.ValidationError('Слишком грубо!')
         return new_post_text
 
+    def clean_image(self):
+        """Проверка и нормализация загруженного изображения"""
+        image = self.cleaned_data['image']
+        if not image or 'image' not in self.changed_data:
+            return image
+        return normalize_upload(image)
+
 
 class CommentForm(forms.ModelForm):
     """Форма комментария к посту"""
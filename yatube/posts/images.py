@@ -0,0 +1,186 @@
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Post
+
+VARIANTS_DIR = 'posts/variants'
+image_storage = Post._meta.get_field('image').storage
+NORMALIZED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+VARIANT_FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+def supported_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеет сохранять Pillow"""
+    Image.init()
+    return [name for name in settings.POST_IMAGE_FORMATS
+            if VARIANT_FORMATS[name][0] in Image.SAVE]
+
+
+def variant_height(width):
+    """Высота варианта с пропорциями миниатюры card"""
+    geometry, _ = settings.POST_IMAGE_GEOMETRIES['card']
+    card_width, card_height = (int(side) for side in geometry.split('x'))
+    return max(width * card_height // card_width, 1)
+
+
+def open_source(name):
+    """Открывает изображение с учётом EXIF-поворота"""
+    with image_storage.open(name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (
+        'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def encode_variant(image, width, name, quality=None):
+    """Кадрирует изображение по центру до ширины width и кодирует"""
+    resized = ImageOps.fit(image, (width, variant_height(width)),
+                           Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, VARIANT_FORMATS[name][0],
+                 quality=quality or settings.POST_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def variant_widths(source_width):
+    """Ширины из POST_IMAGE_WIDTHS без увеличения исходника"""
+    widths = [width for width in settings.POST_IMAGE_WIDTHS
+              if width <= source_width]
+    return widths or [min(settings.POST_IMAGE_WIDTHS)]
+
+
+def generate_variants(name):
+    """Создаёт варианты изображения всех ширин и форматов
+    Возвращает их описание для поля Post.image_variants.
+    """
+    image = open_source(name)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = []
+    for format_name in supported_formats():
+        for width in variant_widths(image.width):
+            data = encode_variant(image, width, format_name)
+            path = image_storage.save(
+                f'{VARIANTS_DIR}/{stem}-{width}.{format_name}',
+                ContentFile(data))
+            variants.append({
+                'source': name,
+                'format': format_name,
+                'width': width,
+                'name': path,
+                'size': len(data),
+            })
+    return variants
+
+
+def load_variants(post):
+    """Варианты текущего изображения поста"""
+    if not post.image or not post.image_variants:
+        return []
+    return [variant for variant in json.loads(post.image_variants)
+            if variant['source'] == post.image.name]
+
+
+def delete_variant_files(variants):
+    """Удаляет файлы вариантов из хранилища"""
+    for variant in variants:
+        image_storage.delete(variant['name'])
+
+
+def release_variants(image_variants):
+    """Снимает ссылки на все варианты из описания image_variants"""
+    delete_variant_files(json.loads(image_variants or '[]'))
+
+
+def store_variants(post_id, name):
+    """Создаёт варианты и сохраняет их описание в посте
+
+    Если изображение поста успело смениться, созданные файлы удаляются.
+    Ссылки на файлы прежних вариантов снимаются после сохранения:
+    хранилище с адресацией по содержимому удалит их, только если
+    на них больше никто не ссылается.
+    """
+    variants = generate_variants(name)
+    post = Post.objects.only('image', 'image_variants').filter(
+        pk=post_id).first()
+    if post is None or post.image.name != name:
+        delete_variant_files(variants)
+        return
+    previous = json.loads(post.image_variants or '[]')
+    Post.objects.filter(pk=post_id).update(
+        image_variants=json.dumps(variants))
+    delete_variant_files(previous)
+
+
+def image_sources(post):
+    """Источники <picture>: srcset по форматам, начиная с лучшего"""
+    sources = []
+    variants = load_variants(post)
+    for format_name in VARIANT_FORMATS:
+        srcset = ', '.join(
+            f'{image_storage.url(variant["name"])} {variant["width"]}w'
+            for variant in variants if variant['format'] == format_name)
+        if srcset:
+            sources.append({
+                'type': VARIANT_FORMATS[format_name][1],
+                'srcset': srcset,
+                'sizes': settings.POST_IMAGE_SIZES,
+            })
+    return sources
+
+
+def open_upload(upload):
+    """Открывает загрузку и проверяет размер по заголовку
+
+    Image.open читает только заголовок, поэтому изображение больше
+    POST_IMAGE_MAX_PIXELS отклоняется до выделения памяти под пиксели.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f'Изображение {width}x{height} слишком большое',
+            code='too_many_pixels')
+    return image
+
+
+def downscale(image, max_edge):
+    """Поворачивает по EXIF и уменьшает до max_edge по большей стороне
+    JPEG сразу декодируется в уменьшенном в 2-8 раз масштабе.
+    """
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image
+
+
+def normalize_upload(upload):
+    """Загрузка, готовая к сохранению: повёрнутая, уменьшенная, без EXIF
+
+    Форматы вне NORMALIZED_FORMATS, например анимированные GIF,
+    сохраняются как есть после проверки размера.
+    """
+    image = open_upload(upload)
+    image_format = image.format
+    if image_format not in NORMALIZED_FORMATS:
+        upload.seek(0)
+        return upload
+    icc_profile = image.info.get('icc_profile')
+    image = downscale(image, settings.POST_IMAGE_MAX_EDGE)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, icc_profile=icc_profile,
+               quality=settings.POST_IMAGE_UPLOAD_QUALITY)
+    return ContentFile(buffer.getvalue(), name=upload.name)
@@ -0,0 +1,234 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from multiprocessing import get_context
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler,
+                                          get_internal_wsgi_application)
+from django.db import connections
+from django.shortcuts import resolve_url
+from django.urls import reverse
+
+from .benchmarks import percentile
+from .models import Post, User
+
+LOAD_USER_PREFIX = 'load_user'
+LOAD_PASSWORD = 'load-test-password'
+LOAD_COMMENT = 'Комментарий нагрузочного теста'
+SAMPLE_POSTS = 1000
+POSTS_PER_VISIT = 3
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Обработчик запросов без строки в журнале на каждый запрос"""
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_server(host='127.0.0.1', port=0):
+    """Запускает WSGI-приложение в отдельном процессе
+
+    Отдаёт адрес сервера. Сервер обслуживает каждое соединение в своём
+    потоке и живёт в другом процессе, чтобы генератор нагрузки не
+    делил с ним GIL.
+    """
+    server = ThreadedWSGIServer((host, port), QuietRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    connections.close_all()
+    process = get_context('fork').Process(target=server.serve_forever,
+                                          daemon=True)
+    process.start()
+    server.server_close()
+    try:
+        yield f'http://{host}:{server.server_port}'
+    finally:
+        process.terminate()
+        process.join()
+
+
+def prepare_sample(users):
+    """Учётные записи для входа и посты, по которым ходят сценарии"""
+    names = [f'{LOAD_USER_PREFIX}{number}' for number in range(users)]
+    existing = set(User.objects.filter(username__in=names).values_list(
+        'username', flat=True))
+    password = make_password(LOAD_PASSWORD)
+    User.objects.bulk_create([User(username=name, password=password)
+                              for name in names if name not in existing])
+    return {
+        'users': names,
+        'posts': list(Post.objects.order_by('-pub_date').values_list(
+            'id', 'author__username', 'group__slug')[:SAMPLE_POSTS]),
+    }
+
+
+class Stats:
+    """Время ответов и ошибки по именам адресов"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, elapsed, ok):
+        self.timings[name].append(elapsed)
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self, name, timings, errors, duration):
+        return {
+            'name': name,
+            'requests': len(timings),
+            'rps': round(len(timings) / duration, 1),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'errors': errors,
+            'error_rate': round(errors / len(timings), 4),
+        }
+
+    def report(self, duration):
+        """Пропускная способность, перцентили и доля ошибок
+
+        Последняя строка с именем total сводит все адреса вместе.
+        """
+        rows = [self.summary(name, timings, self.errors[name], duration)
+                for name, timings in sorted(self.timings.items())]
+        if rows:
+            rows.append(self.summary(
+                'total', sum(self.timings.values(), []),
+                sum(self.errors.values()), duration))
+        return rows
+
+
+class Session:
+    """Посетитель сайта со своими cookie
+
+    Каждый запрос идёт по отдельному соединению. Для POST токен CSRF
+    берётся из cookie csrftoken и передаётся в заголовке X-CSRFToken.
+    Ошибкой считается ответ со статусом, отличным от ожидаемого, и
+    перенаправление на страницу входа.
+    """
+
+    def __init__(self, base_url, stats, timeout):
+        address = urlsplit(base_url)
+        self.host = address.hostname
+        self.port = address.port or 80
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self.login_url = resolve_url(settings.LOGIN_URL)
+
+    async def get(self, name, expect=200, query=None, **kwargs):
+        return await self.request('GET', name, kwargs, expect, query=query)
+
+    async def post(self, name, data, expect=302, **kwargs):
+        return await self.request('POST', name, kwargs, expect, data=data)
+
+    async def request(self, method, name, kwargs, expect, query=None,
+                      data=None):
+        path = reverse(name, kwargs=kwargs or None)
+        if query:
+            path = f'{path}?{urlencode(query)}'
+        started = time.perf_counter()
+        try:
+            status, location = await asyncio.wait_for(
+                self.fetch(method, path, data), self.timeout)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            status = location = None
+        to_login = (location or '').startswith(self.login_url)
+        self.stats.record(name, time.perf_counter() - started,
+                          status == expect and not to_login)
+        return status
+
+    async def fetch(self, method, path, data):
+        """Выполняет запрос, возвращает статус и заголовок Location"""
+        body = urlencode(data or {}).encode()
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}',
+                 'Connection: close']
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(
+                f'{key}={value}' for key, value in self.cookies.items()))
+        if method == 'POST':
+            lines += [f'X-CSRFToken: {self.cookies.get("csrftoken", "")}',
+                      'Content-Type: application/x-www-form-urlencoded',
+                      f'Content-Length: {len(body)}']
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write('\r\n'.join(lines + ['', '']).encode() + body)
+            response = await reader.read()
+        finally:
+            writer.close()
+        head = response.partition(b'\r\n\r\n')[0].decode('latin-1')
+        status_line, *headers = head.split('\r\n')
+        location = None
+        for header in headers:
+            header_name, _, value = header.partition(':')
+            if header_name.lower() == 'set-cookie':
+                for key, morsel in SimpleCookie(value).items():
+                    self.cookies[key] = morsel.value
+            elif header_name.lower() == 'location':
+                location = value.strip()
+        return int(status_line.split()[1]), location
+
+
+async def reader_journey(session, sample, generator):
+    """Аноним листает главную, открывает посты, профиль и сообщество"""
+    await session.get('posts:index')
+    await session.get('posts:index', query={'page': 2})
+    visited = generator.sample(sample['posts'],
+                               min(POSTS_PER_VISIT, len(sample['posts'])))
+    for post_id, _, _ in visited:
+        await session.get('posts:post_detail', post_id=post_id)
+    _, author, group = visited[-1]
+    await session.get('posts:profile', username=author)
+    if group:
+        await session.get('posts:group_posts', slug=group)
+
+
+async def member_journey(session, sample, generator):
+    """Пользователь входит, подписывается, комментирует и читает ленту"""
+    await session.get('users:login')
+    await session.post('users:login', {
+        'username': generator.choice(sample['users']),
+        'password': LOAD_PASSWORD,
+    })
+    post_id, author, _ = generator.choice(sample['posts'])
+    await session.get('posts:profile_follow', expect=302, username=author)
+    await session.get('posts:post_detail', post_id=post_id)
+    await session.post('posts:add_comment', {'text': LOAD_COMMENT},
+                       post_id=post_id)
+    await session.get('posts:follow_index')
+    await session.get('posts:profile_unfollow', expect=302,
+                      username=author)
+
+
+async def virtual_user(base_url, sample, stats, deadline, generator,
+                       member_share, timeout):
+    """Проходит сценарии с новыми cookie до истечения времени"""
+    while time.monotonic() < deadline:
+        journey = (member_journey if generator.random() < member_share
+                   else reader_journey)
+        await journey(Session(base_url, stats, timeout), sample, generator)
+
+
+async def run_load(base_url, sample, concurrency, duration,
+                   member_share=0.2, timeout=30, seed=0):
+    """Нагрузка concurrency одновременных посетителей в течение duration
+
+    Возвращает строки отчёта Stats.report.
+    """
+    stats = Stats()
+    started = time.monotonic()
+    await asyncio.gather(*(
+        virtual_user(base_url, sample, stats, started + duration,
+                     random.Random(seed + number), member_share, timeout)
+        for number in range(concurrency)))
+    return stats.report(time.monotonic() - started)
@@ -0,0 +1,54 @@
+import io
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts.benchmarks import measure, sample_image
+from posts.images import encode_variant, supported_formats, variant_height
+
+
+class Command(BaseCommand):
+    """Размер и время кодирования адаптивных вариантов изображения"""
+    help = ('Сравнивает варианты POST_IMAGE_WIDTHS/POST_IMAGE_FORMATS '
+            'с текущей миниатюрой JPEG по размеру и времени кодирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image',
+                            help='Путь к изображению, по умолчанию '
+                                 'сгенерированное')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options['image']:
+            image = Image.open(options['image']).convert('RGB')
+        else:
+            image = sample_image()
+        geometry, _ = settings.POST_IMAGE_GEOMETRIES['card']
+        card_width = int(geometry.split('x')[0])
+        baseline = self.encode_jpeg(image, card_width)
+        self.stdout.write(f'JPEG {geometry}: {len(baseline)} байт')
+        self.stdout.write(f'{"формат":>8} {"ширина":>8} {"байт":>10} '
+                          f'{"экономия":>10} {"мс":>10}')
+        for format_name in ['jpeg'] + supported_formats():
+            for width in settings.POST_IMAGE_WIDTHS:
+                if format_name == 'jpeg':
+                    encode = self.encode_jpeg
+                else:
+                    def encode(image, width, format_name=format_name):
+                        return encode_variant(image, width, format_name)
+                size = len(encode(image, width))
+                elapsed = measure(lambda: encode(image, width),
+                                  options['repeat'])
+                saved = 100 * (1 - size / len(baseline))
+                self.stdout.write(f'{format_name:>8} {width:>8} {size:>10} '
+                                  f'{saved:>9.1f}% {elapsed:>10.2f}')
+
+    def encode_jpeg(self, image, width):
+        """JPEG с качеством миниатюр sorl, как отдаётся сейчас"""
+        resized = ImageOps.fit(image, (width, variant_height(width)),
+                               Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'JPEG', quality=sorl_settings.THUMBNAIL_QUALITY)
+        return buffer.getvalue()
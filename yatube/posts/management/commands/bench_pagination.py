@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+
+from posts.benchmarks import BENCH_AUTHORS, measure
+from posts.models import Post
+from posts.seeding import seed_missing
+from posts.utils import CursorPaginator
+
+
+class Command(BaseCommand):
+    """Сравнение offset- и курсорной пагинации ленты постов"""
+    help = ('Замеряет время получения страниц 1/1000/10000 ленты '
+            'через Paginator и CursorPaginator')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[1, 1000, 10000])
+        parser.add_argument('--per-page', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--url',
+                            help='Вместо выборки страниц замерить ответ '
+                                 'страницы ленты: размер, время, запросы')
+        parser.add_argument('--seed', action='store_true',
+                            help='Дозаполнить таблицу постов до нужного '
+                                 'количества перед замером')
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        pages = options['pages']
+        required = max(pages) * per_page
+        if options['seed']:
+            seed_missing(BENCH_AUTHORS, 0, required, 0, 0)
+        if options['url']:
+            self.render(options['url'], pages, options['repeat'])
+            return
+        queryset = Post.objects.select_related('author', 'group')
+        total = queryset.count()
+        if total < required:
+            self.stderr.write(f'В базе {total} постов, для страницы '
+                              f'{max(pages)} нужно {required}: '
+                              f'запустите с --seed')
+            return
+        self.stdout.write(f'{"страница":>10} {"offset, мс":>12} '
+                          f'{"cursor, мс":>12}')
+        for number in pages:
+            offset_time = measure(
+                lambda: list(Paginator(queryset, per_page).page(number)),
+                options['repeat'])
+            paginator = CursorPaginator(queryset, per_page)
+            token = None
+            if number > 1:
+                anchor = queryset.order_by(
+                    *paginator.ordering)[(number - 1) * per_page - 1]
+                token = paginator.encode_cursor(anchor)
+            cursor_time = measure(
+                lambda: list(paginator.get_page(token)), options['repeat'])
+            self.stdout.write(f'{number:>10} {offset_time:>12.2f} '
+                              f'{cursor_time:>12.2f}')
+
+    def request(self, client, url):
+        """Запрос с пустым кэшем: замеряется отрисовка, а не попадание"""
+        cache.clear()
+        return client.get(url)
+
+    def render(self, url, pages, repeat):
+        """Размер HTML, время ответа и число запросов для страниц ленты"""
+        client = Client()
+        self.stdout.write(f'{"страница":>10} {"байт":>10} {"мс":>10} '
+                          f'{"запросов":>10}')
+        for number in pages:
+            page_url = f'{url}?page={number}'
+            queries = []
+            with connection.execute_wrapper(
+                    lambda execute, sql, *args: queries.append(sql)
+                    or execute(sql, *args)):
+                response = self.request(client, page_url)
+            elapsed = measure(lambda: self.request(client, page_url), repeat)
+            self.stdout.write(f'{number:>10} {len(response.content):>10} '
+                              f'{elapsed:>10.2f} {len(queries):>10}')
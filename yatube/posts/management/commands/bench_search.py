@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from posts.benchmarks import BENCH_AUTHORS, measure
+from posts.models import Post
+from posts.seeding import seed_missing
+from posts.search import search_posts
+
+
+class Command(BaseCommand):
+    """Сравнение поиска LIKE и полнотекстового индекса"""
+    help = ('Замеряет время первой страницы результатов поиска '
+            'через LIKE и через индекс FTS5')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--queries', nargs='+', default=[
+            'тег4242', 'кофе тег777', 'поезд дождь', 'django sqlite'])
+        parser.add_argument('--per-page', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', action='store_true',
+                            help='Дозаполнить таблицу постов до --posts '
+                                 'перед замером')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            seed_missing(BENCH_AUTHORS, 0, options['posts'], 0, 0)
+        total = Post.objects.count()
+        if total < options['posts']:
+            self.stderr.write(f'В базе {total} постов, нужно '
+                              f'{options["posts"]}: запустите с --seed')
+            return
+        per_page = options['per_page']
+        queryset = Post.objects.select_related('author', 'group')
+        self.stdout.write(f'{"запрос":>20} {"LIKE, мс":>12} '
+                          f'{"FTS5, мс":>12}')
+        for query in options['queries']:
+            like = queryset
+            for word in query.split():
+                like = like.filter(text__icontains=word)
+            like_time = measure(lambda: list(like[:per_page]),
+                                options['repeat'])
+            fts_time = measure(lambda: search_posts(query, None, per_page),
+                               options['repeat'])
+            self.stdout.write(f'{query:>20} {like_time:>12.2f} '
+                              f'{fts_time:>12.2f}')
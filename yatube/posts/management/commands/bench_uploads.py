@@ -0,0 +1,71 @@
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from posts.benchmarks import measure, sample_image
+from posts.images import normalize_upload, open_upload
+
+EXIF_ORIENTATION = 0x0112
+ROTATED = 6
+
+
+def sample_upload(width, height):
+    """Фотография JPEG с EXIF-поворотом, как с телефона"""
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = ROTATED
+    buffer = io.BytesIO()
+    sample_image(width, height).save(buffer, 'JPEG', quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def full_decode(upload, max_edge):
+    """Прежний путь: полное декодирование, затем уменьшение"""
+    upload.seek(0)
+    image = ImageOps.exif_transpose(Image.open(upload))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    image.save(io.BytesIO(), 'JPEG',
+               quality=settings.POST_IMAGE_UPLOAD_QUALITY)
+
+
+def decoded_megabytes(upload, max_edge=None):
+    """Объём пикселей, которые декодер держит в памяти"""
+    image = open_upload(upload)
+    if max_edge:
+        image.draft('RGB', (max_edge, max_edge))
+    width, height = image.size
+    return width * height * len(image.getbands()) / 2 ** 20
+
+
+class Command(BaseCommand):
+    """Время и память нормализации загруженного изображения"""
+    help = ('Сравнивает нормализацию загрузки с draft-декодированием '
+            'и полное декодирование для фотографий разного размера')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+',
+                            default=['2000x1500', '4000x3000', '8000x6000'])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        max_edge = settings.POST_IMAGE_MAX_EDGE
+        self.stdout.write(f'POST_IMAGE_MAX_EDGE = {max_edge}')
+        self.stdout.write(f'{"размер":>10} {"путь":>8} {"МБ пикселей":>12} '
+                          f'{"мс":>10}')
+        for size in options['sizes']:
+            width, height = (int(side) for side in size.split('x'))
+            upload = SimpleUploadedFile('photo.jpg',
+                                        sample_upload(width, height),
+                                        content_type='image/jpeg')
+            paths = (
+                ('draft', decoded_megabytes(upload, max_edge),
+                 lambda: normalize_upload(upload)),
+                ('full', decoded_megabytes(upload),
+                 lambda: full_decode(upload, max_edge)),
+            )
+            for name, megabytes, func in paths:
+                elapsed = measure(func, options['repeat'])
+                self.stdout.write(f'{size:>10} {name:>8} {megabytes:>12.1f} '
+                                  f'{elapsed:>10.2f}')
@@ -0,0 +1,119 @@
+import json
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from posts.benchmarks import bench_sample, percentile
+from posts.seeding import seed_missing
+
+
+def view_urls(dataset):
+    """Адреса представлений постов на объектах набора данных"""
+    return {
+        'index': (reverse('posts:index'), False),
+        'group_posts': (reverse('posts:group_posts', kwargs={
+            'slug': dataset['group'].slug}), False),
+        'profile': (reverse('posts:profile', kwargs={
+            'username': dataset['author'].username}), False),
+        'post_detail': (reverse('posts:post_detail', kwargs={
+            'post_id': dataset['post'].id}), False),
+        'follow_index': (reverse('posts:follow_index'), True),
+    }
+
+
+class Command(BaseCommand):
+    """Замеры представлений постов на наборе данных заданного размера"""
+    help = ('Дозаполняет набор данных генератором seed и замеряет '
+            'p50/p95/p99 времени ответа, число запросов и пик памяти для '
+            'каждого представления и глубины страницы, результат пишет '
+            'в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=500)
+        parser.add_argument('--follows', type=int, default=50)
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[1, 10, 100])
+        parser.add_argument('--views', nargs='+',
+                            choices=['index', 'group_posts', 'profile',
+                                     'post_detail', 'follow_index'])
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warm', action='store_true',
+                            help='Не очищать кэш перед запросами')
+        parser.add_argument('--output', default='bench_views.json')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seed_missing(options['users'], options['groups'],
+                     options['posts'], options['comments'],
+                     options['follows'], feeds=True)
+        dataset = bench_sample()
+        self.stdout.write(f'Набор данных готов за '
+                          f'{time.perf_counter() - started:.1f} с')
+        anonymous, reader = Client(), Client()
+        reader.force_login(dataset['reader'])
+        urls = view_urls(dataset)
+        results = []
+        self.stdout.write(f'{"представление":>14} {"стр.":>5} '
+                          f'{"p50":>8} {"p95":>8} {"p99":>8} '
+                          f'{"запросов":>9} {"пик, КБ":>9}')
+        for view in options['views'] or urls:
+            url, login_required = urls[view]
+            client = reader if login_required else anonymous
+            pages = [1] if view == 'post_detail' else options['pages']
+            for page in pages:
+                result = self.measure(client, f'{url}?page={page}',
+                                      options['repeat'], options['warm'])
+                result.update(view=view, page=page)
+                results.append(result)
+                self.stdout.write(
+                    f'{view:>14} {page:>5} {result["p50_ms"]:>8.2f} '
+                    f'{result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                    f'{result["queries"]:>9} {result["peak_kb"]:>9.0f}')
+        report = {
+            'dataset': {name: options[name] for name in (
+                'users', 'groups', 'posts', 'comments', 'follows')},
+            'repeat': options['repeat'],
+            'warm': options['warm'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def request(self, client, url, warm):
+        if not warm:
+            cache.clear()
+        return client.get(url)
+
+    def measure(self, client, url, repeat, warm):
+        """Перцентили времени, запросы и пик памяти Python для адреса"""
+        queries = []
+        with connection.execute_wrapper(
+                lambda execute, sql, *args: queries.append(sql)
+                or execute(sql, *args)):
+            response = self.request(client, url, warm)
+        tracemalloc.start()
+        self.request(client, url, warm)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.request(client, url, warm)
+            timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.loadtest import local_server, prepare_sample, run_load
+
+
+class Command(BaseCommand):
+    """Нагрузочный тест по сценариям посетителей"""
+    help = ('Запускает приложение и проходит сценарии анонимных и '
+            'вошедших посетителей с растущим числом одновременных '
+            'посетителей. Для каждого адреса выводит запросы в секунду, '
+            'p50/p95/p99 и долю ошибок. Сценарии оставляют комментарии '
+            'и учётные записи load_user*, запускать на тестовой БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Адрес уже запущенного сервера, иначе '
+                                 'приложение запускается локально')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 4, 16, 64])
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Секунд на каждый уровень нагрузки')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Учётных записей для входа')
+        parser.add_argument('--members', type=float, default=0.2,
+                            help='Доля сценариев с входом на сайт')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='load_test.json')
+
+    def handle(self, *args, **options):
+        sample = prepare_sample(options['users'])
+        if not sample['posts']:
+            raise CommandError('Нет постов: заполните БД командой seed')
+        server = (nullcontext(options['url']) if options['url']
+                  else local_server())
+        levels = []
+        with server as base_url:
+            for concurrency in options['concurrency']:
+                rows = asyncio.run(run_load(
+                    base_url, sample, concurrency, options['duration'],
+                    options['members'], options['timeout'],
+                    options['seed']))
+                levels.append({'concurrency': concurrency, 'results': rows})
+                self.write_level(concurrency, rows)
+        with open(options['output'], 'w') as output:
+            json.dump({'duration': options['duration'],
+                       'members': options['members'],
+                       'levels': levels},
+                      output, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def write_level(self, concurrency, rows):
+        self.stdout.write(f'\nПосетителей: {concurrency}')
+        self.stdout.write(f'{"адрес":>22} {"запросов":>9} {"в сек.":>8} '
+                          f'{"p50":>8} {"p95":>8} {"p99":>8} '
+                          f'{"ошибки":>7}')
+        for row in rows:
+            self.stdout.write(
+                f'{row["name"]:>22} {row["requests"]:>9} '
+                f'{row["rps"]:>8.1f} {row["p50_ms"]:>8.2f} '
+                f'{row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f} '
+                f'{row["error_rate"]:>7.1%}')
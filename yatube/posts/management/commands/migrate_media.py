@@ -0,0 +1,69 @@
+import json
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import ContentAddressedStorage
+from core.versions import bump_versions
+from posts.images import image_storage
+from posts.models import Post
+from posts.signals import post_version_scopes
+
+MIGRATE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Перенос изображений постов в хранилище с адресацией по содержимому"""
+    help = ('Пачками по первичному ключу переносит изображения постов '
+            'из плоского каталога posts/ в шардированные пути по хэшу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=MIGRATE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int,
+                            help='Остановиться после стольких пачек')
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='Удалять исходный файл, когда на него '
+                                 'не осталось ссылок')
+
+    def handle(self, *args, **options):
+        if not isinstance(image_storage, ContentAddressedStorage):
+            raise CommandError('Post.image не использует '
+                               'ContentAddressedStorage')
+        queryset = Post.objects.exclude(image='').order_by('pk').only(
+            'pk', 'image', 'image_variants', 'author_id', 'group_id')
+        last_pk, batches = 0, 0
+        while options['max_batches'] is None or (
+                batches < options['max_batches']):
+            posts = list(queryset.filter(pk__gt=last_pk)[
+                :options['batch_size']])
+            if not posts:
+                break
+            last_pk, batches = posts[-1].pk, batches + 1
+            moved = sum(self.move(post, options['delete_originals'])
+                        for post in posts)
+            self.stdout.write(f'Пачка {batches}: до id {last_pk}, '
+                              f'перенесено {moved} из {len(posts)}')
+
+    def move(self, post, delete_original):
+        """Переносит изображение поста, возвращает True при переносе"""
+        original = post.image.name
+        if (image_storage.is_hashed_name(original)
+                or not image_storage.exists(original)):
+            return False
+        with image_storage.open(original) as content:
+            name = image_storage.save(original, File(content))
+        variants = json.loads(post.image_variants or '[]')
+        for variant in variants:
+            variant['source'] = name
+        updated = Post.objects.filter(pk=post.pk, image=original).update(
+            image=name, image_variants=json.dumps(variants))
+        if not updated:
+            image_storage.delete(name)
+            return False
+        bump_versions(*post_version_scopes(post))
+        if delete_original and not Post.objects.filter(
+                image=original).exists():
+            default_storage.delete(original)
+        return True
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import RECONCILE_BATCH_SIZE, reconcile_counters
+
+
+class Command(BaseCommand):
+    """Сверка денормализованных счётчиков с данными"""
+    help = ('Пересчитывает счётчики постов, комментариев и подписок '
+            'пачками и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=RECONCILE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        repaired = reconcile_counters(options['batch_size'])
+        for model, count in repaired.items():
+            self.stdout.write(f'{model}: исправлено {count}')
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.seeding import SEED_CHUNK_SIZE, seed_dataset
+
+
+class Command(BaseCommand):
+    """Генератор синтетического набора данных"""
+    help = ('Создаёт пользователей, сообщества, посты, комментарии и '
+            'подписки со степенным распределением активности авторов и '
+            'подписчиков, вставляя строки пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--processes', type=int,
+                            help='Процессов генерации, по умолчанию '
+                                 'по числу ядер')
+        parser.add_argument('--images', type=float, default=0,
+                            help='Доля постов с заглушкой изображения')
+        parser.add_argument('--feeds', action='store_true',
+                            help='Заполнить ленты подписок')
+        parser.add_argument('--chunk-size', type=int,
+                            default=SEED_CHUNK_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+                cursor.execute('PRAGMA journal_mode = MEMORY')
+        started = time.perf_counter()
+        totals = {}
+
+        def report(stage, count):
+            totals[stage] = totals.get(stage, 0) + count
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{elapsed:8.1f} с  {stage}: {totals[stage]}')
+
+        seed_dataset(options['users'], options['groups'], options['posts'],
+                     options['comments'], options['follows'],
+                     processes=options['processes'],
+                     image_share=options['images'], feeds=options['feeds'],
+                     seed=options['seed'], chunk_size=options['chunk_size'],
+                     report=report)
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+
+from core.metrics import metrics
+from core.versions import get_versions
+
+from .utils import page_cache_path, page_version_scopes
+
+PAGE_CACHE_KEY_PREFIX = 'page'
+
+
+PAGE_CACHE_VIEWS = ('index', 'group_posts', 'profile', 'post_detail')
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых страниц для анонимных GET-запросов
+
+    Стоит до сессий, аутентификации, сообщений и CSRF: попадание в кэш
+    отдаётся без обращения к БД. Ключ включает путь с параметром
+    пагинации из page_cache_path и версии областей, которые увеличивают
+    сигналы моделей.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.cache_key(request)
+        if key is None:
+            return self.get_response(request)
+        response = cache.get(key)
+        if response is not None:
+            metrics.inc('cache_requests_total', cache='page', result='hit')
+            response['X-Page-Cache'] = 'HIT'
+            return get_conditional_response(
+                request, etag=response.get('ETag'), response=response)
+        metrics.inc('cache_requests_total', cache='page', result='miss')
+        response = self.get_response(request)
+        if self.is_cacheable(request, response):
+            patch_cache_control(response, public=True,
+                                max_age=settings.PAGE_CACHE_MAX_AGE)
+            patch_vary_headers(response, ('Cookie',))
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'MISS'
+        return response
+
+    def cache_key(self, request):
+        """Ключ страницы или None, если запрос не кэшируется"""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        cookies = request.COOKIES
+        if (settings.SESSION_COOKIE_NAME in cookies
+                or CookieStorage.cookie_name in cookies):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if (match.namespace != 'posts'
+                or match.url_name not in PAGE_CACHE_VIEWS):
+            return None
+        scopes = page_version_scopes(match.url_name, match.kwargs)
+        versions = '.'.join(str(version) for version in get_versions(scopes))
+        path = hashlib.md5(page_cache_path(request).encode()).hexdigest()
+        return f'{PAGE_CACHE_KEY_PREFIX}:{request.method}:{path}:{versions}'
+
+    def is_cacheable(self, request, response):
+        """Сохранять можно только общий для всех анонимов ответ"""
+        user = getattr(request, 'user', None)
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_USED')
+                and (user is None or not user.is_authenticated))
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 count_first_symbols = 15
 
@@ -11,6 +13,8 @@ class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Семь раз отмерь, один раз напиши')
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата')
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='Дата изменения')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -26,14 +30,35 @@ class Post(models.Model):
     image = models.ImageField(
         'Изображение',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_variants = models.TextField(
+        default='',
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения',
+        help_text='JSON с шириной, форматом и файлом каждого варианта'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев'
+    )
 
     class Meta:
         ordering = ['-pub_date']
         default_related_name = 'posts'
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_id_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_id_idx'),
+        ]
 
     def __str__(self) -> str:
         """Возвращает начало текст поста"""
@@ -52,6 +77,11 @@ class Group(models.Model):
                             help_text='200 символов максимум')
     description = models.TextField(verbose_name='Описание сообщества',
                                    help_text='Тематика постов')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество постов'
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -85,6 +115,10 @@ class Comment(models.Model):
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
         default_related_name = 'comments'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_id_idx'),
+        ]
 
     def __str__(self) -> str:
         """Возвращает начало текста комментария"""
@@ -115,7 +149,87 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='follow_unique',)
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self) -> str:
         """Возвращает сообщение о подписке"""
         return f'{self.user} подписан на автора {self.author}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя"""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self) -> str:
+        """Возвращает описание счётчиков"""
+        return f'Счётчики {self.user}'
+
+
+class FeedItem(models.Model):
+    """Запись в материализованной ленте подписок пользователя"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата поста')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='feed_item_unique',)
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """Возвращает описание записи ленты"""
+        return f'{self.post} в ленте {self.user}'
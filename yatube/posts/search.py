@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import CursorPage
+
+FTS_TABLE = 'posts_post_fts'
+FTS_TRIGGERS = {
+    'posts_post_fts_insert': (
+        'AFTER INSERT ON posts_post BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); '
+        'END'),
+    'posts_post_fts_delete': (
+        'AFTER DELETE ON posts_post BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) '
+        "VALUES ('delete', old.id, old.text); "
+        'END'),
+    'posts_post_fts_update': (
+        'AFTER UPDATE OF text ON posts_post BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) '
+        "VALUES ('delete', old.id, old.text); "
+        f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); '
+        'END'),
+}
+MAX_QUERY_WORDS = 10
+SNIPPET_TOKENS = 24
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+
+def install_search_index(schema_connection):
+    """Создаёт полнотекстовый индекс постов и триггеры синхронизации
+
+    Индекс хранит только словарь, текст берётся из posts_post. SQLite
+    удаляет триггеры вместе с таблицей, поэтому после миграций,
+    пересоздающих posts_post, недостающие триггеры создаются заново,
+    а индекс перестраивается. Возвращает True, если индекс перестроен.
+    """
+    with schema_connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            'AND tbl_name = %s', ['posts_post'])
+        existing = {name for name, in cursor.fetchall()}
+        missing = set(FTS_TRIGGERS) - existing
+        if not missing:
+            return False
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "text, content='posts_post', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')")
+        for name in sorted(missing):
+            cursor.execute(f'CREATE TRIGGER {name} {FTS_TRIGGERS[name]}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_search_index(schema_connection):
+    """Удаляет полнотекстовый индекс постов и его триггеры"""
+    with schema_connection.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def match_expression(query):
+    """Запрос FTS5 из слов пользовательской строки
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 в строке
+    поиска не работают и не могут вызвать синтаксическую ошибку.
+    """
+    words = re.findall(r'\w+', query)[:MAX_QUERY_WORDS]
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def matching_posts(queryset, query):
+    """Посты queryset, в тексте которых есть все слова запроса"""
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_expression(query)]))
+
+
+def encode_cursor(score, post_id):
+    """Упаковывает позицию результата поиска в токен"""
+    raw = json.dumps([score, post_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен, для некорректного возвращает None"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        score, post_id = json.loads(raw.decode())
+        return float(score), int(post_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и выделяет в нём найденные слова"""
+    return mark_safe(escape(snippet).replace(
+        SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+
+def search_posts(query, cursor, per_page):
+    """Страница результатов поиска по тексту постов
+
+    Результаты упорядочены по релевантности bm25, при равной - от новых
+    постов к старым. Следующая страница выбирается по токену с оценкой
+    и id последнего результата, без OFFSET. Найденным постам
+    добавляются атрибуты search_rank и search_snippet.
+    """
+    match = match_expression(query)
+    if not match:
+        return CursorPage([])
+    sql = (f'SELECT rowid, bm25({FTS_TABLE}) AS score, '
+           f'snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+           f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ')
+    params = [SNIPPET_START, SNIPPET_END, '…', SNIPPET_TOKENS, match]
+    position = decode_cursor(cursor)
+    if position is not None:
+        sql += (f'AND (bm25({FTS_TABLE}) > %s OR '
+                f'(bm25({FTS_TABLE}) = %s AND rowid < %s)) ')
+        params += [position[0], position[0], position[1]]
+    sql += 'ORDER BY score, rowid DESC LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [row[0] for row in rows[:per_page]])
+    results = []
+    for post_id, score, snippet in rows[:per_page]:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        post.search_rank = score
+        post.search_snippet = highlight(snippet)
+        results.append(post)
+    next_cursor = None
+    if len(rows) > per_page:
+        post_id, score, _ = rows[per_page - 1]
+        next_cursor = encode_cursor(score, post_id)
+    return CursorPage(results, next_cursor)
@@ -0,0 +1,374 @@
+import io
+import multiprocessing
+import os
+import random
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Max
+from PIL import Image
+
+from core.models import StoredBlob
+
+from .counters import recount_counters
+from .feed import backfill_feed
+from .images import image_storage
+from .models import Comment, Follow, Group, Post, User
+from .search import FTS_TABLE, FTS_TRIGGERS, install_search_index
+
+SEED_USER_PREFIX = 'seed_user'
+SEED_GROUP_PREFIX = 'seed-group'
+SEED_CHUNK_SIZE = 50000
+SEED_DAYS = 365 * 3
+POWER_LAW_EXPONENT = 1.2
+BURST_MEAN_POSTS = 4
+BURST_MEAN_GAP = 60 * 10
+GROUP_SHARE = 0.7
+COMMENT_MEAN_DELAY = 60 * 60 * 24
+PLACEHOLDER_IMAGES = 8
+PERMUTATION_PRIME = 2147483647
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Лев', 'Фёдор',
+               'Софья', 'Антон', 'Вера')
+LAST_NAMES = ('Иванов', 'Толстой', 'Чехов', 'Смирнов', 'Пушкин', 'Гоголь',
+              'Бунин', 'Петров', 'Лермонтов', 'Орлов')
+SEED_TAGS = 10000
+SEED_WORDS = (
+    'город', 'море', 'кофе', 'поезд', 'книга', 'вечер', 'музыка', 'дождь',
+    'горы', 'кино', 'утро', 'собака', 'сад', 'зима', 'дорога', 'письмо',
+    'python', 'django', 'sqlite', 'yatube',
+)
+
+_context = {}
+
+
+def set_context(context):
+    """Параметры генерации для процесса пула"""
+    _context.clear()
+    _context.update(context)
+
+
+def power_law_index(generator, size, exponent=POWER_LAW_EXPONENT):
+    """Индекс от 0 до size - 1, малые выпадают по степенному закону"""
+    power = 1 - exponent
+    value = (((size + 1) ** power - 1) * generator.random() + 1) ** (
+        1 / power)
+    return min(int(value) - 1, size - 1)
+
+
+def permuted(index, size):
+    """Индекс, перемешанный биекцией, чтобы популярные не шли подряд"""
+    return index * PERMUTATION_PRIME % size
+
+
+def seed_text(generator, words=12):
+    """Текст из частых SEED_WORDS и одного редкого тега"""
+    return ' '.join(generator.choices(SEED_WORDS, k=words)
+                    + [f'тег{generator.randrange(SEED_TAGS)}'])
+
+
+def format_datetime(moment):
+    return moment.strftime(DATETIME_FORMAT)
+
+
+def user_rows(task):
+    """Пользователи: пароль не задан, имена из коротких списков"""
+    start, count, seed = task
+    generator = random.Random(seed)
+    joined = format_datetime(_context['started'])
+    return [
+        ('!', None, False, f'{SEED_USER_PREFIX}{number}',
+         generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES),
+         f'{SEED_USER_PREFIX}{number}@example.com', False, True, joined)
+        for number in range(start, start + count)
+    ]
+
+
+def post_rows(task):
+    """Посты отрезка времени, который приходится на пачку
+
+    Авторы выбираются по степенному закону и пишут сериями из
+    нескольких постов подряд, посты идут по возрастанию даты.
+    """
+    start, count, seed = task
+    generator = random.Random(seed)
+    authors, groups = _context['authors'], _context['groups']
+    images, image_share = _context['images'], _context['image_share']
+    span = _context['span'] / _context['posts']
+    window_start = _context['started'] + timedelta(seconds=start * span)
+    window = count * span
+    rows = []
+    while len(rows) < count:
+        author = authors[permuted(power_law_index(generator, len(authors)),
+                                  len(authors))]
+        moment = window_start + timedelta(seconds=generator.random() * window)
+        burst = 1 + int(generator.expovariate(1 / BURST_MEAN_POSTS))
+        for _ in range(min(burst, count - len(rows))):
+            group = None
+            if groups and generator.random() < GROUP_SHARE:
+                group = groups[power_law_index(generator, len(groups))]
+            image = ''
+            if images and generator.random() < image_share:
+                image = generator.choice(images)
+            rows.append((author, group, seed_text(generator),
+                         format_datetime(moment), format_datetime(moment),
+                         image, '', 0))
+            moment += timedelta(
+                seconds=generator.expovariate(1 / BURST_MEAN_GAP))
+    rows.sort(key=lambda row: row[3])
+    return rows
+
+
+def comment_rows(task):
+    """Комментарии к постам, популярность постов по степенному закону"""
+    start, count, seed = task
+    generator = random.Random(seed)
+    post_ids = _context['post_ids']
+    posts = len(post_ids)
+    authors = _context['authors']
+    span = _context['span']
+    rows = []
+    for _ in range(count):
+        index = permuted(power_law_index(generator, posts), posts)
+        created = _context['started'] + timedelta(
+            seconds=index * span / posts
+            + generator.expovariate(1 / COMMENT_MEAN_DELAY))
+        rows.append((post_ids[index], generator.choice(authors),
+                     seed_text(generator, 6), format_datetime(created)))
+    return rows
+
+
+def follow_rows(task):
+    """Подписки: число подписчиков автора по степенному закону"""
+    start, count, seed = task
+    generator = random.Random(seed)
+    authors = _context['authors']
+    rows = set()
+    for _ in range(count):
+        user = generator.choice(authors)
+        author = authors[permuted(power_law_index(generator, len(authors)),
+                                  len(authors))]
+        if user != author:
+            rows.add((user, author))
+    return sorted(rows)
+
+
+def insert_rows(model, fields, rows, ignore_conflicts=False):
+    """Вставляет готовые значения колонок одним executemany"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column)
+                        for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = (f'{connection.ops.insert_statement(ignore_conflicts)} '
+           f'{quote(model._meta.db_table)} ({columns}) '
+           f'VALUES ({placeholders})'
+           f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts)}')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def chunks(total, chunk_size, seed, offset=0):
+    """Задачи генерации: начало, размер и зерно пачки"""
+    return [(start, min(chunk_size, offset + total - start), seed + start)
+            for start in range(offset, offset + total, chunk_size)]
+
+
+@contextmanager
+def pool(processes, context):
+    """Пул процессов с контекстом генерации или None для одного процесса
+
+    Процессы создаются через fork: функции генерации живут рядом с
+    моделями, и порождённому с нуля процессу пришлось бы настраивать
+    Django. Без fork строки готовятся в текущем процессе.
+    """
+    set_context(context)
+    if (processes <= 1
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        yield None
+        return
+    executor = ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context('fork'),
+        initializer=set_context, initargs=(context,))
+    try:
+        yield executor
+    finally:
+        executor.shutdown()
+
+
+def generate(executor, func, tasks):
+    """Результаты func по задачам в порядке задач
+
+    В пуле одновременно считается не больше двух пачек на процесс,
+    чтобы готовые строки не копились в памяти быстрее, чем их вставляют.
+    """
+    if executor is None:
+        for task in tasks:
+            yield func(task)
+        return
+    window = executor._max_workers * 2
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(func, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def placeholder_images():
+    """Несколько одноцветных JPEG в хранилище изображений постов"""
+    names = []
+    generator = random.Random(PLACEHOLDER_IMAGES)
+    for number in range(PLACEHOLDER_IMAGES):
+        color = tuple(generator.randrange(256) for _ in range(3))
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+        names.append(image_storage.save(f'posts/seed{number}.jpg',
+                                        ContentFile(buffer.getvalue())))
+    return names
+
+
+def suspend_search_index():
+    """Убирает триггеры полнотекстового индекса на время вставки
+    Возвращает True, если индекс есть и его нужно перестроить.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s",
+                       [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return False
+        for name in FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    return True
+
+
+def seed_users(executor, users, seed, chunk_size, report):
+    """Вставляет пользователей после уже созданных в прошлые запуски"""
+    fields = ('password', 'last_login', 'is_superuser', 'username',
+              'first_name', 'last_name', 'email', 'is_staff', 'is_active',
+              'date_joined')
+    existing = User.objects.filter(
+        username__startswith=SEED_USER_PREFIX).count()
+    for rows in generate(executor, user_rows,
+                         chunks(users, chunk_size, seed, existing)):
+        insert_rows(User, fields, rows)
+        report('users', len(rows))
+
+
+def seed_groups(groups, report):
+    existing = Group.objects.filter(
+        slug__startswith=SEED_GROUP_PREFIX).count()
+    Group.objects.bulk_create(
+        Group(title=f'Сообщество {number}',
+              slug=f'{SEED_GROUP_PREFIX}-{number}',
+              description=seed_text(random.Random(number)))
+        for number in range(existing, existing + groups))
+    report('groups', groups)
+
+
+def seed_posts(executor, posts, seed, chunk_size, report):
+    """Вставляет посты и учитывает ссылки на заглушки изображений"""
+    fields = ('author', 'group', 'text', 'pub_date', 'updated', 'image',
+              'image_variants', 'comments_count')
+    image_refs = Counter()
+    for rows in generate(executor, post_rows,
+                         chunks(posts, chunk_size, seed)):
+        insert_rows(Post, fields, rows)
+        image_refs.update(row[5] for row in rows if row[5])
+        report('posts', len(rows))
+    for name, refs in image_refs.items():
+        StoredBlob.objects.filter(name=name).update(refs=F('refs') + refs)
+
+
+def seed_relations(executor, comments, follows, seed, chunk_size, report):
+    """Вставляет комментарии и подписки"""
+    for rows in generate(executor, comment_rows,
+                         chunks(comments, chunk_size, seed)):
+        insert_rows(Comment, ('post', 'author', 'text', 'created'), rows)
+        report('comments', len(rows))
+    for rows in generate(executor, follow_rows,
+                         chunks(follows, chunk_size, seed)):
+        insert_rows(Follow, ('user', 'author'), rows,
+                    ignore_conflicts=True)
+        report('follows', len(rows))
+
+
+def seed_dataset(users, groups, posts, comments, follows, processes=None,
+                 image_share=0, feeds=False, seed=0,
+                 chunk_size=SEED_CHUNK_SIZE, report=None):
+    """Генерирует набор данных заданного размера
+
+    Строки готовятся пачками в пуле из processes процессов и
+    вставляются в БД одним процессом через executemany. Сигналы
+    не срабатывают: счётчики сверяются после вставки, полнотекстовый
+    индекс перестраивается один раз, а ленты подписок при feeds
+    заполняются как при подписке.
+    """
+    report = report or (lambda stage, count: None)
+    processes = os.cpu_count() if processes is None else processes
+    context = {
+        'started': datetime.utcnow() - timedelta(days=SEED_DAYS),
+        'span': SEED_DAYS * 24 * 60 * 60,
+        'posts': posts,
+        'image_share': image_share,
+        'images': placeholder_images() if image_share else [],
+    }
+    rebuild_search = suspend_search_index()
+    seed_groups(groups, report)
+    with pool(processes, context) as executor:
+        seed_users(executor, users, seed, chunk_size, report)
+    context['authors'] = list(User.objects.filter(
+        username__startswith=SEED_USER_PREFIX).values_list('id', flat=True))
+    context['groups'] = list(Group.objects.filter(
+        slug__startswith=SEED_GROUP_PREFIX).values_list('id', flat=True))
+    if context['authors']:
+        last_post = Post.objects.aggregate(last=Max('id'))['last'] or 0
+        with pool(processes, context) as executor:
+            seed_posts(executor, posts, seed, chunk_size, report)
+        context['post_ids'] = list(Post.objects.filter(
+            id__gt=last_post).order_by('id').values_list('id', flat=True))
+        with pool(processes, context) as executor:
+            seed_relations(executor,
+                           comments if context['post_ids'] else 0, follows,
+                           seed, chunk_size, report)
+    finish(rebuild_search, feeds, report)
+
+
+def seed_missing(users, groups, posts, comments, follows, **options):
+    """Досоздаёт набор данных до заданных размеров
+
+    Уже созданные пользователи и сообщества генератора, а также все
+    посты, комментарии и подписки в БД вычитаются из размеров. Если
+    ничего не недостаёт, индекс поиска и ленты не перестраиваются.
+    """
+    existing = (
+        User.objects.filter(username__startswith=SEED_USER_PREFIX).count(),
+        Group.objects.filter(slug__startswith=SEED_GROUP_PREFIX).count(),
+        Post.objects.count(), Comment.objects.count(),
+        Follow.objects.count())
+    missing = [max(required - count, 0) for required, count in zip(
+        (users, groups, posts, comments, follows), existing)]
+    if any(missing):
+        seed_dataset(*missing, **options)
+
+
+def finish(rebuild_search, feeds, report):
+    """Сверяет счётчики, перестраивает индекс поиска и ленты"""
+    recount_counters()
+    report('counters', 0)
+    if rebuild_search:
+        install_search_index(connection)
+        report('search', 0)
+    if feeds:
+        follows = Follow.objects.filter(
+            user__username__startswith=SEED_USER_PREFIX).values_list(
+            'user_id', 'author_id')
+        for user_id, author_id in follows.iterator():
+            backfill_feed(user_id, author_id)
+        report('feeds', 0)
@@ -0,0 +1,197 @@
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from core.versions import bump_versions
+
+from .autocomplete import autocomplete_index
+from .counters import bump_group_posts, bump_post_comments, bump_user_stats
+from .feed import backfill_feed, clear_feed, fan_out_post, forget_post
+from .images import release_variants
+from .models import Comment, Follow, Group, Post
+from .search import FTS_TABLE, install_search_index
+from .utils import invalidate_counts
+
+User = get_user_model()
+USER_INDEXED_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def post_count_scopes(post):
+    """Ленты, количество постов в которых зависит от поста"""
+    scopes = ['posts', f'author:{post.author_id}']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def post_version_scopes(post, previous_group_id=None):
+    """Области версий фрагментов, в которых выводится пост"""
+    scopes = ['posts', post, f'user:{post.author_id}']
+    for group_id in {post.group_id, previous_group_id} - {None}:
+        scopes.append(f'group:{group_id}')
+    return scopes
+
+
+def release_previous_image(post):
+    """Снимает ссылку на прежний файл изображения после замены
+    Повторная загрузка того же содержимого тоже добавляет ссылку.
+    Варианты убранного изображения освобождаются здесь же, варианты
+    заменённого - в store_variants после создания новых.
+    """
+    previous_image = getattr(post, '_previous_image', '')
+    if previous_image and (previous_image != post.image.name
+                           or getattr(post, '_image_uploaded', False)):
+        post.image.storage.delete(previous_image)
+    release_variants(getattr(post, '_released_variants', ''))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    """Запоминает сообщество и изображение поста до редактирования
+    Если изображение убрано, описание его вариантов очищается.
+    """
+    instance._previous_group_id, instance._previous_image = None, ''
+    instance._released_variants = ''
+    instance._image_uploaded = (bool(instance.image)
+                                and not instance.image._committed)
+    if instance.pk is not None:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image', 'image_variants').first()
+        if previous is not None:
+            (instance._previous_group_id, instance._previous_image,
+             variants) = previous
+            if not instance.image:
+                instance._released_variants = variants
+                instance.image_variants = ''
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    """Новый пост попадает в ленты подписчиков и счётчики"""
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    bump_versions(*post_version_scopes(instance, previous_group_id))
+    if created:
+        bump_user_stats(instance.author_id, posts_count=1)
+        bump_group_posts(instance.group_id, 1)
+        invalidate_counts(*post_count_scopes(instance))
+        fan_out_post(instance)
+    elif previous_group_id != instance.group_id:
+        bump_group_posts(previous_group_id, -1)
+        bump_group_posts(instance.group_id, 1)
+        invalidate_counts(f'group:{previous_group_id}',
+                          f'group:{instance.group_id}')
+    release_previous_image(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    """Запоминает варианты изображения: задача миниатюр могла записать
+    их уже после загрузки удаляемого объекта."""
+    instance._released_variants = Post.objects.filter(
+        pk=instance.pk).values_list('image_variants', flat=True).first()
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Удалённый пост уменьшает счётчики"""
+    bump_versions(*post_version_scopes(instance))
+    bump_user_stats(instance.author_id, posts_count=-1)
+    bump_group_posts(instance.group_id, -1)
+    invalidate_counts(*post_count_scopes(instance))
+    forget_post(instance)
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+    release_variants(getattr(instance, '_released_variants', ''))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    """После подписки лента заполняется постами автора"""
+    bump_versions('follows', f'user:{instance.user_id}',
+                  f'user:{instance.author_id}')
+    if created:
+        bump_user_stats(instance.author_id, followers_count=1)
+        bump_user_stats(instance.user_id, following_count=1)
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты"""
+    bump_versions('follows', f'user:{instance.user_id}',
+                  f'user:{instance.author_id}')
+    bump_user_stats(instance.author_id, followers_count=-1)
+    bump_user_stats(instance.user_id, following_count=-1)
+    clear_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """Новый комментарий увеличивает счётчик поста"""
+    bump_versions(f'post:{instance.post_id}')
+    if created:
+        bump_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """Удалённый комментарий уменьшает счётчик поста"""
+    bump_versions(f'post:{instance.post_id}')
+    bump_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Изменение сообщества устаревает фрагменты с его постами"""
+    bump_versions('posts', 'groups', instance)
+    autocomplete_index.update_group(
+        instance, deleted=kwargs['signal'] is post_delete)
+
+
+def user_names_saved(update_fields):
+    """Может ли сохранение менять имена пользователя на страницах
+    Сохранение только last_login при входе их не трогает.
+    """
+    return (update_fields is None
+            or bool(set(USER_INDEXED_FIELDS) & set(update_fields)))
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    """Запоминает имена пользователя до сохранения"""
+    instance._previous_names = None
+    if instance.pk is not None and user_names_saved(update_fields):
+        instance._previous_names = User.objects.filter(
+            pk=instance.pk).values_list(*USER_INDEXED_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    """Новое имя пользователя попадает в индекс автодополнения
+    и устаревает страницы и фрагменты с его постами и комментариями.
+    """
+    if not user_names_saved(update_fields):
+        return
+    autocomplete_index.update_user(instance)
+    previous = getattr(instance, '_previous_names', None)
+    names = tuple(getattr(instance, field) for field in USER_INDEXED_FIELDS)
+    if previous is not None and previous != names:
+        bump_versions('posts', 'users', instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Удалённый пользователь пропадает из автодополнения"""
+    autocomplete_index.update_user(instance, deleted=True)
+
+
+@receiver(post_migrate)
+def posts_migrated(sender, using, **kwargs):
+    """Возвращает триггеры поиска, если миграция пересоздала posts_post"""
+    connection = connections[using]
+    if (sender.name == 'posts' and connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()):
+        install_search_index(connection)
@@ -0,0 +1,53 @@
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from .images import image_storage
+
+# Закрытые методы бэкенда и хранилища sorl-thumbnail могут измениться в
+# любом выпуске, поэтому все обращения к ним собраны в этом модуле. Тесты
+# сверяют установленную версию с SORL_VERSION, с которой проверен модуль.
+SORL_VERSION = '12.7.0'
+
+
+def thumbnail_name(name, geometry, options):
+    """Имя файла миниатюры, которое получит get_thumbnail из sorl
+    Опции дополняются по умолчанию так же, как в ThumbnailBackend.
+    """
+    backend = default.backend
+    source = ImageFile(name, image_storage)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def kvstore_get_many(keys):
+    """Записи хранилища sorl одним обращением к кэшу
+    Ключи, которых нет в кэше, дочитываются из БД одним запросом.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        values = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStore.objects.filter(key__in=missing).values_list(
+            'key', 'value'))
+        kvstore.cache.set_many(
+            {key: stored.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {key: value for key, value in values.items()
+            if value != EMPTY_VALUE}
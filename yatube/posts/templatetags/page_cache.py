@@ -0,0 +1,11 @@
+from django import template
+
+from ..utils import page_cache_path
+
+register = template.Library()
+
+
+@register.filter(name='page_cache_path')
+def page_cache_path_filter(request):
+    """{% versioned_cache 3600 index_page request|page_cache_path %}"""
+    return page_cache_path(request)
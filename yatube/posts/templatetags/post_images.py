@@ -0,0 +1,55 @@
+import logging
+
+from django import template
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from ..images import image_sources
+from ..models import Post
+from ..thumbnails import prefetch_thumbnails, thumbnail_pending
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_post_thumbnails(posts, name='card'):
+    """{% prefetch_post_thumbnails page_obj %} перед циклом по постам
+    или {% prefetch_post_thumbnails post %} для одного поста
+    """
+    if isinstance(posts, Post):
+        posts = [posts]
+    prefetch_thumbnails(posts, name)
+    return ''
+
+
+@register.simple_tag
+def post_thumbnail(post, name='card'):
+    """Миниатюра изображения поста размера из POST_IMAGE_GEOMETRIES
+
+    Берётся из prefetch_post_thumbnails, если он был вызван для
+    страницы. Пока миниатюры готовятся в фоне, возвращает None,
+    и шаблон выводит заглушку. Ошибки обрабатываются как в теге
+    thumbnail.
+    """
+    prefetched = getattr(post, 'prefetched_thumbnails', None)
+    if prefetched is not None:
+        return prefetched.get(name)
+    image = post.image
+    if not image or thumbnail_pending(image):
+        return None
+    geometry, options = settings.POST_IMAGE_GEOMETRIES[name]
+    try:
+        return get_thumbnail(image, geometry, **options)
+    except Exception:
+        if sorl_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Thumbnail failed for %s', image)
+        return None
+
+
+@register.simple_tag
+def post_image_sources(post):
+    """Источники <picture> с вариантами изображения поста"""
+    return image_sources(post)
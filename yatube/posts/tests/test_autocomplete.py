@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..autocomplete import AutocompleteIndex, autocomplete_index, change_key
+from ..models import Group
+
+User = get_user_model()
+
+
+class AutocompleteTests(TestCase):
+    """Тестирование индекса автодополнения."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='leo', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Русская классика',
+            slug='classic',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.reset()
+        autocomplete_index.build()
+
+    def tearDown(self):
+        autocomplete_index.reset()
+
+    def labels(self, query):
+        return [entry.label for entry in autocomplete_index.search(query)]
+
+    def test_prefix_and_substring(self):
+        """Поиск по началу имени, слова названия и части фамилии."""
+        self.assertEqual(self.labels('LE'), ['Лев Толстой'])
+        self.assertEqual(self.labels('толс'), ['Лев Толстой'])
+        self.assertEqual(self.labels('лст'), ['Лев Толстой'])
+        self.assertEqual(self.labels('класс'), ['Русская классика'])
+        self.assertEqual(self.labels('assi'), ['Русская классика'])
+        self.assertEqual(self.labels('ёж'), [])
+
+    def test_search_without_queries(self):
+        """Построенный индекс отвечает без обращений к БД."""
+        with self.assertNumQueries(0):
+            autocomplete_index.search('лев')
+
+    def test_updated_from_signals(self):
+        """Переименование и удаление меняют индекс без перестройки."""
+        user = User.objects.create_user(username='fedor',
+                                        first_name='Фёдор')
+        self.group.title = 'Проза'
+        self.group.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('фёд'), ['Фёдор'])
+            self.assertEqual(self.labels('проз'), ['Проза'])
+            self.assertEqual(self.labels('класс'), [])
+        user.delete()
+        self.assertEqual(self.labels('фёд'), [])
+
+    def test_changes_replayed_in_other_process(self):
+        """Другой процесс применяет изменения из кэша без перестройки."""
+        other = AutocompleteIndex()
+        other.build()
+        User.objects.create_user(username='fedor', first_name='Фёдор')
+        self.group.title = 'Проза'
+        self.group.save()
+        with self.assertNumQueries(0):
+            labels = [entry.label for entry in other.search('фёд')]
+            self.assertEqual(labels, ['Фёдор'])
+            self.assertEqual(other.search('класс'), [])
+        self.assertIsNone(other.builder)
+        self.assertEqual(other.version, autocomplete_index.version)
+
+    def test_missing_change_rebuilds_index(self):
+        """Без изменения в кэше индекс перестраивается из БД."""
+        other = AutocompleteIndex()
+        other.build()
+        User.objects.create_user(username='fedor', first_name='Фёдор')
+        cache.delete(change_key(autocomplete_index.version))
+        with mock.patch('posts.autocomplete.CHANGE_WAIT', 0):
+            labels = [entry.label for entry in other.search('фёд')]
+        self.assertEqual(labels, ['Фёдор'])
+
+    def test_login_does_not_touch_index(self):
+        """Сохранение last_login не меняет версию индекса."""
+        version = autocomplete_index.version
+        Client().force_login(self.user)
+        self.assertEqual(autocomplete_index.version, version)
+
+    def test_endpoint(self):
+        """Эндпоинт возвращает подсказки со ссылками."""
+        response = Client().get(reverse('posts:autocomplete'), {'q': 'ле'})
+        self.assertEqual(response.json(), {'results': [{
+            'type': 'user',
+            'label': 'Лев Толстой',
+            'url': reverse('posts:profile', kwargs={'username': 'leo'}),
+        }]})
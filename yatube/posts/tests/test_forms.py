@@ -1,3 +1,4 @@
+import io
 import shutil
 import tempfile
 
@@ -7,7 +8,9 @@ from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from ..forms import PostForm
 from ..models import Comment, Group, Post
 
 User = get_user_model()
@@ -117,3 +120,39 @@ class FormsTests(TestCase):
         self.assertTrue(Comment.objects.filter(post=self.post.id,
                                                text=form_data['text'],
                                                ).exists())
+
+
+class ImageUploadTests(TestCase):
+    """Тестирование нормализации загруженных изображений."""
+
+    def upload(self, width, height, orientation=None):
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'red').save(
+            buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    def clean(self, upload):
+        form = PostForm(data={'text': 'Lorem ipsum dolor sit amet'},
+                        files={'image': upload})
+        return form, form.is_valid()
+
+    @override_settings(POST_IMAGE_MAX_EDGE=100)
+    def test_image_oriented_and_downscaled(self):
+        """Изображение поворачивается по EXIF, уменьшается и теряет EXIF."""
+        form, valid = self.clean(self.upload(400, 200, orientation=6))
+        self.assertTrue(valid)
+        image = Image.open(form.cleaned_data['image'])
+        self.assertEqual(image.size, (50, 100))
+        self.assertEqual(dict(image.getexif()), {})
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_rejected(self):
+        """Изображение с огромным числом пикселей отклоняется."""
+        form, valid = self.clean(self.upload(100, 20))
+        self.assertFalse(valid)
+        self.assertEqual(form.errors['image'],
+                         ['Изображение 100x20 слишком большое'])
@@ -1,9 +1,25 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import StoredBlob
 
-from ..models import Group, Post, count_first_symbols
+from ..counters import reconcile_counters
+from ..models import (Comment, Follow, Group, Post, UserStats,
+                      count_first_symbols)
+from ..seeding import seed_dataset, seed_missing
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class PostModelTest(TestCase):
@@ -91,3 +107,134 @@ class PostModelTest(TestCase):
             test_post: post_help_text,
         }
         PostModelTest.run_test_scheme(self, test_scheme, check_attribute)
+
+
+class CountersTest(TestCase):
+    """Тестирование денормализованных счётчиков"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='default_slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Lorem ipsum dolor sit amet')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(UserStats.objects.filter(
+            posts_count=0, followers_count=0, following_count=0).count(), 2)
+
+    def test_reconcile_counters(self):
+        """Команда сверки исправляет расхождения счётчиков."""
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Lorem ipsum dolor sit amet')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        Post.objects.filter(pk=post.pk).update(comments_count=7)
+        Group.objects.filter(pk=self.group.pk).update(posts_count=0)
+        UserStats.objects.all().delete()
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         1)
+        self.assertIn('posts: исправлено 1', out.getvalue())
+
+    def test_seed_dataset_counters(self):
+        """Сгенерированный набор данных согласован со счётчиками."""
+        seed_dataset(users=20, groups=3, posts=300, comments=100,
+                     follows=50, processes=0, chunk_size=64)
+        self.assertEqual(User.objects.filter(
+            username__startswith='seed_user').count(), 20)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(reconcile_counters(),
+                         {'posts': 0, 'groups': 0, 'users': 0})
+
+    def test_seed_missing_skips_complete_dataset(self):
+        """Полный набор данных не пересобирается повторным запуском."""
+        seed_missing(users=5, groups=1, posts=20, comments=10, follows=0,
+                     processes=0)
+        self.assertEqual(Post.objects.count(), 20)
+        with mock.patch('posts.seeding.seed_dataset') as seed:
+            seed_missing(users=5, groups=1, posts=20, comments=10,
+                         follows=0, processes=0)
+        seed.assert_not_called()
+
+    def test_seed_dataset_after_deleted_posts(self):
+        """Комментарии ссылаются на вставленные посты и после удалений."""
+        seed_dataset(users=5, groups=0, posts=20, comments=0, follows=0,
+                     processes=0)
+        Post.objects.filter(pk__in=Post.objects.order_by('-id').values(
+            'id')[:5]).delete()
+        seed_dataset(users=0, groups=0, posts=20, comments=50, follows=0,
+                     processes=0)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertFalse(Comment.objects.exclude(
+            post__in=Post.objects.all()).exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaMigrationTest(TestCase):
+    """Тестирование переноса изображений в хранилище по хэшу."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_migrate_media(self):
+        """Старые изображения переносятся пачками, дубли хранятся раз."""
+        author = User.objects.create_user(username='author')
+        default_storage.save('posts/one.gif', ContentFile(b'same'))
+        default_storage.save('posts/two.gif', ContentFile(b'same'))
+        posts = [
+            Post.objects.create(author=author, text='Первый пост',
+                                image='posts/one.gif'),
+            Post.objects.create(author=author, text='Второй пост',
+                                image='posts/two.gif'),
+        ]
+        out = StringIO()
+        call_command('migrate_media', batch_size=1, delete_originals=True,
+                     stdout=out)
+        for post in posts:
+            post.refresh_from_db()
+        self.assertEqual(posts[0].image.name, posts[1].image.name)
+        self.assertEqual(StoredBlob.objects.get(
+            name=posts[0].image.name).refs, 2)
+        self.assertFalse(default_storage.exists('posts/one.gif'))
+        self.assertFalse(default_storage.exists('posts/two.gif'))
+        self.assertTrue(os.path.exists(posts[0].image.path))
+        self.assertIn('Пачка 2', out.getvalue())
+        posts[0].delete()
+        self.assertTrue(os.path.exists(posts[1].image.path))
+        posts[1].delete()
+        self.assertFalse(os.path.exists(posts[1].image.path))
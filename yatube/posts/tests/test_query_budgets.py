@@ -0,0 +1,146 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import urls
+from ..models import Comment, Follow, Group, Post
+from ..thumbnails import generate_thumbnails
+from ..views import COMMENTS_ON_PAGE, POSTS_ON_PAGE
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+# Наибольшее число запросов к БД на один ответ с холодным кэшем.
+# Бюджет не зависит от числа постов и комментариев на странице.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_posts': 5,
+    'posts:profile': 5,
+    'posts:post_detail': 4,
+    'posts:post_comments': 2,
+    'posts:search': 2,
+    'posts:autocomplete': 2,
+    'posts:post_create': 3,
+    'posts:post_edit': 4,
+    'posts:add_comment': 5,
+    'posts:follow_index': 6,
+    'posts:profile_follow': 4,
+    'posts:profile_unfollow': 9,
+}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    """Проверка бюджетов запросов к БД для всех адресов posts."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='default_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        for number in range(POSTS_ON_PAGE * 2 - 1):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group,
+                text=f'Тестовый пост номер {number}',
+                image=SimpleUploadedFile(f'small{number}.gif', SMALL_GIF,
+                                         content_type='image/gif'))
+            generate_thumbnails(post.id, post.image.name)
+        cls.post = Post.objects.latest('pub_date')
+        for number in range(COMMENTS_ON_PAGE + 1):
+            Comment.objects.create(post=cls.post, author=cls.follower,
+                                   text=f'Комментарий {number}')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.guest = Client()
+        self.reader = Client()
+        self.reader.force_login(self.follower)
+        self.writer = Client()
+        self.writer.force_login(self.author)
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def route_requests(self):
+        """Запросы к каждому адресу: полная и неполная страница"""
+        post = {'post_id': self.post.id}
+        author = {'username': self.author.username}
+        pages = [{'page': 1}, {'page': 2}]
+        return {
+            'posts:index': [(self.guest, 'get', {}, page)
+                            for page in pages],
+            'posts:group_posts': [
+                (self.guest, 'get', {'slug': self.group.slug}, page)
+                for page in pages],
+            'posts:profile': [(self.guest, 'get', author, page)
+                              for page in pages],
+            'posts:post_detail': [(self.guest, 'get', post, {})],
+            'posts:post_comments': [(self.guest, 'get', post, {})],
+            'posts:search': [(self.guest, 'get', {}, {'q': 'пост'})],
+            'posts:autocomplete': [(self.guest, 'get', {}, {'q': 'au'})],
+            'posts:post_create': [(self.writer, 'get', {}, {})],
+            'posts:post_edit': [(self.writer, 'get', post, {})],
+            'posts:add_comment': [
+                (self.reader, 'post', post, {'text': 'Новый комментарий'})],
+            'posts:follow_index': [(self.reader, 'get', {}, page)
+                                   for page in pages],
+            'posts:profile_follow': [(self.reader, 'get', author, {})],
+            'posts:profile_unfollow': [(self.reader, 'get', author, {})],
+        }
+
+    def assertQueryBudget(self, name, client, method, kwargs, data):
+        """Число запросов ответа не больше бюджета адреса"""
+        budget = QUERY_BUDGETS[name]
+        url = reverse(name, kwargs=kwargs or None)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        if len(queries) > budget:
+            executed = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(queries.captured_queries, 1))
+            self.fail(f'{name} {url} {data}: {len(queries)} запросов '
+                      f'при бюджете {budget}:\n{executed}')
+
+    def test_all_routes_have_budgets(self):
+        """Каждому адресу posts назначен бюджет и запросы для проверки."""
+        names = {f'{urls.app_name}:{pattern.name}'
+                 for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+        self.assertEqual(names, set(self.route_requests()))
+
+    def test_routes_stay_within_budget(self):
+        """Адреса posts укладываются в бюджет запросов к БД."""
+        for name, requests in self.route_requests().items():
+            for client, method, kwargs, data in requests:
+                with self.subTest(name=name, data=data):
+                    self.assertQueryBudget(name, client, method, kwargs,
+                                           data)
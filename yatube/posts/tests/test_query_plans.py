@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+POSTS_TABLES = ('posts_',)
+
+
+class QueryPlanTests(TestCase):
+    """Проверка планов запросов страниц ленты."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='author')
+        cls.user_follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='default_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user_follower, author=cls.user_author)
+        posts = [
+            Post.objects.create(author=cls.user_author, group=cls.group,
+                                text=f'Тестовый пост номер {i}')
+            for i in range(15)
+        ]
+        cls.post = posts[0]
+        for i in range(5):
+            Comment.objects.create(post=cls.post, author=cls.user_follower,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user_follower)
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def capture_queries(self, url):
+        """Выполняет запрос страницы и возвращает её SELECT-запросы"""
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def query_plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def feed_urls(self):
+        """Ленты с пагинацией по номеру страницы и по курсору"""
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user_author.username}),
+            reverse('posts:follow_index'),
+        ]
+
+    def cursor_urls(self, url):
+        """Первая и вторая страницы ленты в курсорной пагинации"""
+        page = self.client.get(url + '?cursor=').context['page_obj']
+        return [url + '?cursor=', url + f'?cursor={page.next_cursor}']
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы целиком
+        и не сортируют во временном B-дереве."""
+        feeds = self.feed_urls()
+        urls = feeds + [
+            reverse('posts:index') + '?page=2',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for feed in feeds:
+            urls.extend(self.cursor_urls(feed))
+        for url in urls:
+            for sql, params in self.capture_queries(url):
+                if not any(table in sql for table in POSTS_TABLES):
+                    continue
+                plan = self.query_plan(sql, params)
+                with self.subTest(url=url, sql=sql, plan=plan):
+                    for detail in plan:
+                        self.assertNotIn('TEMP B-TREE', detail)
+                        if detail.startswith('SCAN'):
+                            self.assertIn('INDEX', detail)
+
+    def test_cursor_pages_seek_in_index(self):
+        """Следующая страница курсора начинается поиском по индексу
+        с позиции курсора, а не обходом ленты с начала."""
+        for feed in self.feed_urls():
+            url = self.cursor_urls(feed)[1]
+            details = [detail
+                       for sql, params in self.capture_queries(url)
+                       for detail in self.query_plan(sql, params)]
+            with self.subTest(url=url, plan=details):
+                self.assertTrue(any(
+                    detail.startswith('SEARCH') and 'pub_date<?' in detail
+                    for detail in details))
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import (FTS_TRIGGERS, install_search_index, match_expression,
+                      search_posts)
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    """Тестирование полнотекстового поиска."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='author')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.post = Post.objects.create(
+            author=cls.user_author,
+            text='Кофе и <b>поезд</b> ранним утром',
+        )
+        cls.other = Post.objects.create(
+            author=cls.user_author,
+            text='Поезд, поезд и ещё раз поезд',
+        )
+
+    def test_index_follows_writes(self):
+        """Индекс обновляется при создании, изменении и удалении."""
+        post = Post.objects.create(author=self.user_author, text='дождь')
+        self.assertEqual(list(search_posts('дождь', None, 10)), [post])
+        Post.objects.filter(pk=post.pk).update(text='снег')
+        self.assertEqual(list(search_posts('дождь', None, 10)), [])
+        self.assertEqual(list(search_posts('снег', None, 10)), [post])
+        post.delete()
+        self.assertEqual(list(search_posts('снег', None, 10)), [])
+
+    def test_results_ranked(self):
+        """Более релевантный пост идёт первым."""
+        self.assertEqual(list(search_posts('поезд', None, 10)),
+                         [self.other, self.post])
+
+    def test_snippet_escaped_and_highlighted(self):
+        """Фрагмент экранирован, найденные слова выделены."""
+        post, = search_posts('кофе', None, 10)
+        self.assertIn('<mark>Кофе</mark>', post.search_snippet)
+        self.assertIn('&lt;b&gt;', post.search_snippet)
+
+    def test_cursor_pagination(self):
+        """Следующая страница выбирается по курсору."""
+        first = search_posts('поезд', None, 1)
+        self.assertEqual(list(first), [self.other])
+        second = search_posts('поезд', first.next_cursor, 1)
+        self.assertEqual(list(second), [self.post])
+        self.assertFalse(second.has_next())
+        self.assertEqual(list(search_posts('поезд', 'bad', 1)), [self.other])
+
+    def test_query_operators_ignored(self):
+        """Операторы FTS5 в строке поиска не вызывают ошибок."""
+        self.assertEqual(match_expression('"поезд" OR (кофе*'),
+                         '"поезд" "OR" "кофе"')
+        self.assertEqual(list(search_posts('"', None, 10)), [])
+
+    def test_search_view(self):
+        """Страница поиска выводит найденные посты."""
+        response = Client().get(reverse('posts:search'), {'q': 'кофе'})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_admin_search(self):
+        """Поиск в админке использует индекс."""
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'кофе'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.post])
+
+    def test_triggers_restored(self):
+        """Пропавшие триггеры создаются заново с перестройкой индекса."""
+        self.assertFalse(install_search_index(connection))
+        with connection.cursor() as cursor:
+            for name in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {name}')
+        post = Post.objects.create(author=self.user_author, text='метель')
+        self.assertTrue(install_search_index(connection))
+        self.assertEqual(list(search_posts('метель', None, 10)), [post])
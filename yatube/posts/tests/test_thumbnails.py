@@ -0,0 +1,197 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import sorl
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.models import KVStore
+
+from core.jobs import work
+from core.models import Job, StoredBlob
+
+from ..images import load_variants
+from ..models import Post
+from ..sorl_backend import SORL_VERSION, thumbnail_name
+from ..thumbnails import (generate_thumbnails, pending_key,
+                          prefetch_thumbnails)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_QUEUE=False)
+class ThumbnailTests(TransactionTestCase):
+    """Тестирование генерации миниатюр при загрузке."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user_author = User.objects.create_user(username='author')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user_author)
+
+    def create_post(self):
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Lorem ipsum dolor sit amet',
+            'image': SimpleUploadedFile('small.gif', SMALL_GIF,
+                                        content_type='image/gif'),
+        })
+        return Post.objects.order_by('-id').first()
+
+    def test_thumbnails_generated_on_create(self):
+        """Миниатюры создаются при публикации поста."""
+        post = self.create_post()
+        thumbnails = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertTrue(any(files for _, _, files in os.walk(thumbnails)))
+        self.assertIsNone(cache.get(pending_key(post.image.name)))
+
+    @override_settings(THUMBNAIL_QUEUE=True)
+    def test_thumbnails_generated_by_job(self):
+        """Миниатюры создаёт задача очереди, а не запрос."""
+        with mock.patch('posts.thumbnails.in_memory_database',
+                        return_value=False):
+            post = self.create_post()
+        self.assertTrue(Job.objects.filter(
+            task='posts.thumbnails.generate_thumbnails').exists())
+        self.assertIsNotNone(cache.get(pending_key(post.image.name)))
+        self.assertEqual(work(), 1)
+        self.assertIsNone(cache.get(pending_key(post.image.name)))
+        self.assertEqual(prefetch_thumbnails([post]), [])
+
+    def test_placeholder_while_pending(self):
+        """Пока миниатюры готовятся, вместо картинки выводится заглушка."""
+        post = self.create_post()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        cache.set(pending_key(post.image.name), True)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'thumbnail-placeholder')
+        self.assertNotContains(response, '<img class="card-img')
+        generate_thumbnails(post.id, post.image.name)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, '<img class="card-img')
+
+    def test_prefetch_matches_get_thumbnail(self):
+        """Миниатюры страницы находятся одним обращением к хранилищу."""
+        for _ in range(3):
+            self.create_post()
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            self.assertEqual(prefetch_thumbnails(posts), [])
+        geometry, options = settings.POST_IMAGE_GEOMETRIES['card']
+        for post in posts:
+            self.assertEqual(
+                post.prefetched_thumbnails['card'].url,
+                get_thumbnail(post.image, geometry, **options).url)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(prefetch_thumbnails(posts), [])
+
+    def test_prefetch_reports_misses(self):
+        """Недостающие миниатюры не создаются в запросе, а ставятся в пул."""
+        post = self.create_post()
+        KVStore.objects.all().delete()
+        cache.clear()
+        self.assertEqual(prefetch_thumbnails([post]), [post])
+        self.assertEqual(post.prefetched_thumbnails, {})
+        self.assertEqual(prefetch_thumbnails([post]), [])
+
+    def test_failed_thumbnail_not_requeued(self):
+        """Неудачная генерация не повторяется при каждом показе страницы."""
+        post = self.create_post()
+        KVStore.objects.all().delete()
+        cache.clear()
+        with mock.patch('posts.thumbnails.get_thumbnail',
+                        side_effect=OSError) as generate:
+            self.assertEqual(prefetch_thumbnails([post]), [post])
+            self.assertEqual(prefetch_thumbnails([post]), [post])
+        self.assertEqual(generate.call_count, 1)
+
+    def test_thumbnail_name_matches_sorl(self):
+        """Имя миниатюры совпадает с именем из get_thumbnail этой версии."""
+        self.assertEqual(sorl.__version__, SORL_VERSION,
+                         'сверьте posts.sorl_backend с новой версией sorl')
+        post = self.create_post()
+        for geometry, options in [
+                *settings.POST_IMAGE_GEOMETRIES.values(),
+                ('100x100', {}), ('50', {'format': 'PNG', 'quality': 50})]:
+            with self.subTest(geometry=geometry, options=options):
+                self.assertEqual(
+                    thumbnail_name(post.image.name, geometry, options),
+                    get_thumbnail(post.image, geometry, **options).name)
+
+    @override_settings(POST_IMAGE_FORMATS=('webp',))
+    def test_variants_in_srcset(self):
+        """Варианты изображения создаются и попадают в srcset."""
+        post = self.create_post()
+        variants = load_variants(post)
+        self.assertEqual([(variant['format'], variant['width'])
+                          for variant in variants], [('webp', 400)])
+        self.assertTrue(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, variants[0]['name'])))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, f'{variants[0]["name"]} 400w')
+
+    @override_settings(POST_IMAGE_FORMATS=('webp',))
+    def test_variants_released_on_delete(self):
+        """Удаление поста освобождает файлы вариантов."""
+        post = self.create_post()
+        variant, = load_variants(post)
+        post.image_variants = ''
+        post.delete()
+        self.assertFalse(StoredBlob.objects.filter(
+            name=variant['name']).exists())
+        self.assertFalse(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, variant['name'])))
+
+    @override_settings(POST_IMAGE_FORMATS=('webp',))
+    def test_variants_released_with_cleared_image(self):
+        """Убранное из поста изображение освобождает файлы вариантов."""
+        post = self.create_post()
+        variant, = load_variants(post)
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, '')
+        self.assertFalse(StoredBlob.objects.filter(
+            name=variant['name']).exists())
+
+    @override_settings(POST_IMAGE_FORMATS=('webp',))
+    def test_variants_replaced_with_image(self):
+        """Новое изображение заменяет варианты прежнего."""
+        post = self.create_post()
+        previous, = load_variants(post)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}), data={
+                'text': post.text,
+                'image': SimpleUploadedFile('other.gif', OTHER_GIF,
+                                            content_type='image/gif'),
+            })
+        post.refresh_from_db()
+        current, = load_variants(post)
+        self.assertNotEqual(current['name'], previous['name'])
+        self.assertFalse(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, previous['name'])))
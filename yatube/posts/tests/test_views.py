@@ -1,15 +1,24 @@
 import shutil
 import tempfile
+from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
+
+from core.jobs import work
 
 from ..forms import CommentForm, PostForm
-from ..models import Comment, Follow, Group, Post
+from ..models import Comment, FeedItem, Follow, Group, Post
+from ..utils import CachedCountPaginator, count_cache_key
+from ..views import COMMENTS_ON_PAGE
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -236,6 +245,96 @@ class PaginatorViewsTest(TestCase):
                 response = self.authorized_client.get(reverse_name)
                 self.assertEqual(len(response.context['page_obj']), post_count)
 
+    def test_pages_cached_separately(self):
+        """Фрагмент ленты кэшируется отдельно для каждой страницы."""
+        cache.clear()
+        self.authorized_client.get(reverse('posts:index'))
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?page=2')
+        self.assertEqual(response.content.decode().count('<article>'), 3)
+
+    def test_page_window(self):
+        """Пагинатор выводит окно страниц вокруг текущей."""
+        paginator = CachedCountPaginator(range(500), 10)
+        self.assertEqual(paginator.page_window(25),
+                         [1, None, 23, 24, 25, 26, 27, None, 50])
+        self.assertEqual(paginator.page_window(2), [1, 2, 3, 4, None, 50])
+
+    def test_count_cache_invalidation(self):
+        """Количество постов берётся из кэша и сбрасывается
+        при создании и удалении поста."""
+        cache.clear()
+        self.authorized_client.get(reverse('posts:index'))
+        key = count_cache_key('posts')
+        self.assertEqual(cache.get(key)[0], self.posts_count)
+        new_post = Post.objects.create(author=self.user_author,
+                                       text='Ещё один пост')
+        self.assertIsNone(cache.get(key))
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(cache.get(key)[0], self.posts_count + 1)
+        new_post.delete()
+        self.assertIsNone(cache.get(key))
+
+    def test_deep_page_number_capped(self):
+        """Слишком большой номер страницы возвращает последнюю."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?page=' + '9' * 30)
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_page_numbers_capped(self):
+        """Страницы, окно и ссылка на последнюю не глубже MAX_PAGE_NUMBER,
+        дальше лента продолжается курсором."""
+        cache.clear()
+        posts = list(Post.objects.order_by('-pub_date', '-id'))
+        with mock.patch('posts.utils.MAX_PAGE_NUMBER', 5):
+            paginator = CachedCountPaginator(posts, 1)
+            self.assertEqual(paginator.num_pages, 5)
+            self.assertEqual(paginator.page_window(5), [1, None, 3, 4, 5])
+        with mock.patch('posts.utils.MAX_PAGE_NUMBER', 1):
+            response = self.authorized_client.get(
+                reverse('posts:index') + '?page=20000')
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 1)
+        self.assertEqual(page.paginator.num_pages, 1)
+        self.assertNotContains(response, '?page=')
+        self.assertContains(response, f'?cursor={page.next_cursor}')
+        response = self.authorized_client.get(
+            reverse('posts:index') + f'?cursor={page.next_cursor}')
+        self.assertEqual(list(response.context['page_obj']), posts[10:])
+
+    def test_cursor_pagination(self):
+        """Курсорная пагинация проходит ленту вперёд и назад
+        без пропусков и повторов."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user_author.username}),
+        ]
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for url in urls:
+            with self.subTest(url=url):
+                first_page = self.authorized_client.get(
+                    url + '?cursor=').context['page_obj']
+                self.assertEqual(list(first_page), expected[:10])
+                self.assertFalse(first_page.has_previous())
+                second_page = self.authorized_client.get(
+                    url + f'?cursor={first_page.next_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(second_page), expected[10:])
+                self.assertFalse(second_page.has_next())
+                back_page = self.authorized_client.get(
+                    url + f'?cursor={second_page.previous_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(back_page), expected[:10])
+                self.assertFalse(back_page.has_previous())
+
+    def test_cursor_pagination_invalid_token(self):
+        """Некорректный токен возвращает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?cursor=broken')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class CacheViewsTest(TestCase):
     """Тестирование кэширования."""
@@ -258,13 +357,14 @@ class CacheViewsTest(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user_author)
+        cache.clear()
 
     def test_cache_on_index_page(self):
         """Проверка кэширования на главной странице."""
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertTrue(f'{self.post.text}'
                         in str(response.content))
-        Post.objects.get(pk=self.post.id).delete()
+        Post.objects.filter(pk=self.post.id).update(text='Новый текст')
         response_with_cache = self.authorized_client.get(reverse
                                                          ('posts:index'))
         self.assertTrue(f'{self.post.text}'
@@ -275,6 +375,239 @@ class CacheViewsTest(TestCase):
         self.assertFalse(f'{self.post.text}'
                          in str(response_clear_cache.content))
 
+    def test_profile_shows_renamed_group(self):
+        """Новое название и адрес сообщества сразу видны в профиле."""
+        url = reverse('posts:profile',
+                      kwargs={'username': self.user_author.username})
+        self.authorized_client.get(url)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.slug = 'new_slug'
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Новое название')
+        self.assertContains(response, reverse(
+            'posts:group_posts', kwargs={'slug': 'new_slug'}))
+
+    def test_cache_invalidated_on_write(self):
+        """Удаление поста сразу устаревает кэш главной страницы."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertTrue(f'{self.post.text}' in str(response.content))
+        Post.objects.get(pk=self.post.id).delete()
+        response_after_delete = self.authorized_client.get(
+            reverse('posts:index'))
+        self.assertFalse(f'{self.post.text}'
+                         in str(response_after_delete.content))
+
+
+class PageCacheTest(TestCase):
+    """Тестирование кэша страниц для анонимных пользователей."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user_author,
+            text='Lorem ipsum dolor sit amet',
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_anonymous_hit_without_queries(self):
+        """Повторный анонимный запрос отдаётся из кэша без запросов к БД."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertIn('public', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, self.post.text)
+
+    def test_page_invalidated_by_signals(self):
+        """Запись модели сбрасывает закэшированные страницы."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest_client.get(url)
+        Comment.objects.create(post=self.post, author=self.user_author,
+                               text='Свежий комментарий')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_cache_key_ignores_other_params(self):
+        """Посторонние параметры запроса не создают новых ключей кэша."""
+        url = reverse('posts:index')
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'MISS')
+        for params in ({'utm_source': 'feed'}, {'page': 1, 'x': 'y'},
+                       {'page': 'junk'}, {'page': '01'}):
+            with self.subTest(params=params), self.assertNumQueries(0):
+                response = self.guest_client.get(url, params)
+                self.assertEqual(response['X-Page-Cache'], 'HIT')
+        response = self.guest_client.get(url, {'page': 0})
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+    def test_user_rename_invalidates_pages(self):
+        """Новое имя автора сразу видно на страницах с его постами."""
+        group = Group.objects.create(title='Тестовая группа',
+                                     slug='default_slug')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        authorized_client = Client()
+        authorized_client.force_login(self.user_author)
+        index = reverse('posts:index')
+        group_url = reverse('posts:group_posts', kwargs={'slug': group.slug})
+        self.guest_client.get(index)
+        authorized_client.get(group_url)
+        self.user_author.first_name = 'Переименованный'
+        self.user_author.save()
+        response = self.guest_client.get(index)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Переименованный')
+        self.assertContains(authorized_client.get(group_url),
+                            'Переименованный')
+
+    def test_authorized_requests_bypass_cache(self):
+        """Запросы с сессией не кэшируются."""
+        authorized_client = Client()
+        authorized_client.force_login(self.user_author)
+        response = authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class ConditionalGetTest(TestCase):
+    """Тестирование условных GET-запросов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='default_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user_author,
+            group=cls.group,
+            text='Lorem ipsum dolor sit amet',
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user_author)
+
+    def test_not_modified_without_rendering(self):
+        """Совпавший ETag возвращает 304 без рендеринга страницы."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user_author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertTrue(response.has_header('ETag'))
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertIsNone(response.templates or None)
+
+    def test_if_modified_since_does_not_hide_changes(self):
+        """If-Modified-Since без ETag не отдаёт 304 после комментария
+        или правки поста."""
+        since = http_date()
+        post_url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+        index_url = reverse('posts:index')
+        self.assertFalse(
+            self.authorized_client.get(post_url).has_header('Last-Modified'))
+        Comment.objects.create(post=self.post, author=self.user_author,
+                               text='Комментарий')
+        response = self.authorized_client.get(
+            post_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Комментарий')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Исправленный текст'})
+        response = self.authorized_client.get(
+            index_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Исправленный текст')
+
+    def test_new_comment_changes_etag(self):
+        """Новый комментарий меняет ETag страницы поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.authorized_client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.user_author,
+                               text='Комментарий')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class CommentsViewsTest(TestCase):
+    """Тестирование порций комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user_author,
+            text='Lorem ipsum dolor sit amet',
+        )
+        commentators = [
+            User.objects.create_user(username=f'reader{number}')
+            for number in range(COMMENTS_ON_PAGE + 5)]
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=author, text=f'Комментарий {number}')
+            for number, author in enumerate(commentators))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_batch_inline(self):
+        """Страница поста выводит только первую порцию комментариев."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_ON_PAGE)
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'comments-more')
+
+    def test_next_batch_endpoint(self):
+        """Курсор из ссылки возвращает оставшиеся комментарии."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        first = response.context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'cursor': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/view_comments.html')
+        rest = response.context['comments']
+        self.assertEqual(len(rest), 5)
+        self.assertFalse(rest.has_next())
+        self.assertFalse({comment.id for comment in first}
+                         & {comment.id for comment in rest})
+
+    def test_comment_authors_joined(self):
+        """Авторы комментариев загружаются тем же запросом."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_unknown_post(self):
+        """Комментарии несуществующего поста - 404."""
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
 
 class FollowViewsTest(TestCase):
     """Тестирование функционала подписок."""
@@ -346,3 +679,41 @@ class FollowViewsTest(TestCase):
         response_no_follower = self.auth_client_no_follower.get(
             reverse('posts:follow_index'))
         self.assertEqual(len(response_no_follower.context['page_obj']), 0)
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленты подписчиков,
+        после отписки записи ленты удаляются."""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_author)
+        new_post = Post.objects.create(author=self.user_author,
+                                       text='Свежий пост для ленты')
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user_follower, post=new_post).exists())
+        self.assertFalse(FeedItem.objects.filter(
+            user=self.user_no_follower).exists())
+        Follow.objects.filter(user=self.user_follower,
+                              author=self.user_author).delete()
+        self.assertFalse(FeedItem.objects.filter(
+            user=self.user_follower).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_author_posts_fanned_out_by_jobs(self):
+        """Посты авторов сверх порога подписчиков раскладываются
+        очередью задач пачками, чтение ленты ничего не пишет в БД."""
+        for user in (self.user_follower, self.user_no_follower):
+            Follow.objects.create(user=user, author=self.user_author)
+        new_post = Post.objects.create(author=self.user_author,
+                                       text='Пост популярного автора')
+        self.assertFalse(FeedItem.objects.filter(post=new_post).exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.auth_client_follower.get(reverse('posts:follow_index'))
+        self.assertFalse([query for query in queries.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+        with mock.patch('posts.feed.FEED_BATCH_SIZE', 1):
+            self.assertEqual(work(), 3)
+        self.assertEqual(FeedItem.objects.filter(post=new_post).count(), 2)
+        response = self.auth_client_follower.get(
+            reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [new_post, self.post])
+        self.assertContains(response, 'Пост популярного автора')
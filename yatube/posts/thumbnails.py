@@ -0,0 +1,127 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.jobs import enqueue
+from core.metrics import metrics
+from core.versions import bump_versions
+
+from .images import image_storage, store_variants
+from .models import Post
+from .signals import post_version_scopes
+from .sorl_backend import kvstore_get_many, thumbnail_name
+from .utils import in_memory_database
+
+logger = logging.getLogger(__name__)
+PENDING_KEY_PREFIX = 'thumbnail:pending'
+RETRY_KEY_PREFIX = 'thumbnail:retry'
+
+
+def pending_key(name):
+    """Ключ отметки о том, что миниатюры изображения ещё готовятся"""
+    return f'{PENDING_KEY_PREFIX}:{name}'
+
+
+def retry_key(name):
+    """Ключ отметки о том, что миниатюры изображения уже ставились в очередь"""
+    return f'{RETRY_KEY_PREFIX}:{name}'
+
+
+def thumbnail_pending(image):
+    """Готовятся ли ещё миниатюры изображения"""
+    return bool(image) and cache.get(pending_key(image.name)) is not None
+
+
+def generate_thumbnails(post_id, name):
+    """Создаёт миниатюры всех размеров из POST_IMAGE_GEOMETRIES
+    и адаптивные варианты изображения
+
+    После генерации снимает отметку ожидания и увеличивает версии
+    фрагментов с постом, чтобы заглушка в кэше сменилась картинкой.
+    Неудачная генерация не повторяется из prefetch_thumbnails
+    THUMBNAIL_RETRY_TIMEOUT секунд.
+    """
+    started = time.perf_counter()
+    try:
+        for geometry, options in settings.POST_IMAGE_GEOMETRIES.values():
+            get_thumbnail(ImageFile(name, image_storage), geometry,
+                          **options)
+        store_variants(post_id, name)
+    except Exception:
+        logger.exception('Thumbnail generation failed for %s', name)
+        cache.set(retry_key(name), True, settings.THUMBNAIL_RETRY_TIMEOUT)
+    finally:
+        metrics.observe('thumbnail_generation_seconds',
+                        time.perf_counter() - started)
+        metrics.flush()
+        cache.delete(pending_key(name))
+        post = Post.objects.filter(pk=post_id).first()
+        if post is not None:
+            bump_versions(*post_version_scopes(post))
+
+
+def enqueue_thumbnails(post):
+    """Ставит генерацию миниатюр поста в очередь задач core.jobs
+
+    Задача появляется в очереди вместе с коммитом транзакции, переживает
+    перезапуск приложения и выполняется воркером manage.py run_jobs.
+    При THUMBNAIL_QUEUE = False или БД SQLite в памяти миниатюры
+    создаются сразу после коммита в том же потоке.
+    """
+    if not post.image:
+        return
+    post_id, name = post.pk, post.image.name
+    transaction.on_commit(lambda: cache.set(
+        pending_key(name), True, settings.THUMBNAIL_PENDING_TIMEOUT))
+    if not settings.THUMBNAIL_QUEUE or in_memory_database():
+        transaction.on_commit(lambda: generate_thumbnails(post_id, name))
+        return
+    enqueue(generate_thumbnails, args=(post_id, name),
+            priority=settings.THUMBNAIL_PRIORITY)
+
+
+def prefetch_thumbnails(posts, name='card'):
+    """Находит готовые миниатюры всех постов страницы разом
+
+    Каждому посту добавляется словарь prefetched_thumbnails. Миниатюры,
+    которых ещё нет, не создаются в запросе: их генерация ставится в
+    очередь задач не чаще раза в THUMBNAIL_RETRY_TIMEOUT секунд на
+    изображение, а сами посты возвращаются списком промахов.
+    """
+    geometry, options = settings.POST_IMAGE_GEOMETRIES[name]
+    with_images = []
+    for post in posts:
+        post.prefetched_thumbnails = {}
+        if post.image:
+            with_images.append(post)
+    pending = cache.get_many(
+        [pending_key(post.image.name) for post in with_images])
+    keys = {
+        post.pk: add_prefix(ImageFile(thumbnail_name(
+            post.image.name, geometry, options)).key)
+        for post in with_images
+        if pending_key(post.image.name) not in pending
+    }
+    stored = kvstore_get_many(list(keys.values()))
+    misses = []
+    for post in with_images:
+        if post.pk not in keys:
+            continue
+        value = stored.get(keys[post.pk])
+        if value is None:
+            misses.append(post)
+            continue
+        post.prefetched_thumbnails[name] = deserialize_image_file(value)
+    for post in misses:
+        if cache.add(retry_key(post.image.name), True,
+                     settings.THUMBNAIL_RETRY_TIMEOUT):
+            logger.warning('Thumbnail %s is missing for %s', name,
+                           post.image.name)
+            enqueue_thumbnails(post)
+    return misses
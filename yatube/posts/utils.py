@@ -1,11 +1,286 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.views.decorators.http import condition
+
+from core.caching import get_or_compute
+from core.versions import get_versions
+
+CURSOR_ORDERING = ('-pub_date', '-id')
+COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+MAX_PAGE_NUMBER = 1000
+PAGE_WINDOW = 2
+
+
+def in_memory_database():
+    """Работает ли процесс с БД SQLite в памяти"""
+    return connection.vendor == 'sqlite' and connection.is_in_memory_db()
+
+
+def count_cache_key(scope):
+    """Ключ кэша количества объектов ленты"""
+    return f'posts:count:{scope}'
+
+
+def invalidate_counts(*scopes):
+    """Сбрасывает закэшированные количества объектов лент"""
+    cache.delete_many([count_cache_key(scope) for scope in scopes])
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator с количеством объектов из кэша и окном номеров страниц
+
+    count_key задаёт ленту, например 'group:1'; без него количество
+    считается запросом, как в Paginator.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self._count_objects()
+        return get_or_compute(count_cache_key(self.count_key),
+                              self._count_objects, COUNT_CACHE_TIMEOUT,
+                              name='paginator_count')
+
+    def _count_objects(self):
+        return super().count
+
+    @cached_property
+    def num_pages(self):
+        """Число страниц, не больше MAX_PAGE_NUMBER
+
+        Дальше последней доступной страницы лента листается курсором,
+        has_more_pages показывает, что за ней есть ещё объекты.
+        """
+        pages = super().num_pages
+        self.has_more_pages = pages > MAX_PAGE_NUMBER
+        return min(pages, MAX_PAGE_NUMBER)
+
+    def page_window(self, number, size=PAGE_WINDOW):
+        """Номера страниц вокруг текущей, первая и последняя
+        Пропуски между ними обозначены None.
+        """
+        last = self.num_pages
+        numbers = sorted({1, last} | set(range(
+            max(number - size, 1), min(number + size, last) + 1)))
+        window = []
+        for previous, current in zip([0] + numbers, numbers):
+            if current - previous > 1:
+                window.append(None)
+            window.append(current)
+        return window
+
+
+class CursorPage:
+    """Страница курсорной пагинации
+
+    В отличие от Page не знает ни номера страницы, ни общего количества
+    объектов, только токены соседних страниц.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинация по ключу сортировки (keyset) без COUNT и OFFSET
+
+    Позиция на странице передаётся непрозрачным токеном, в котором
+    закодированы значения полей сортировки крайнего объекта страницы.
+    Последнее поле ordering должно быть уникальным.
+    """
+
+    def __init__(self, queryset, per_page, ordering=CURSOR_ORDERING):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj, backwards=False):
+        """Упаковывает позицию объекта в токен"""
+        values = [field.value_to_string(obj) for field in self.fields]
+        raw = json.dumps([int(backwards), values]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """Распаковывает токен, для некорректного возвращает None"""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            backwards, values = json.loads(raw.decode())
+            if len(values) != len(self.fields):
+                return None
+            values = [field.to_python(value)
+                      for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+        return values, bool(backwards)
+
+    def _after(self, values, backwards):
+        """Условие «строго после позиции» в порядке обхода
+
+        Перед OR по полям сортировки стоит нестрогое условие на первое
+        поле: по нему БД начинает обход индекса с позиции курсора и идёт
+        в порядке сортировки, не собирая строки для MULTI-INDEX OR и
+        не досортировывая их во временном B-дереве.
+        """
+        lookups = ['lt' if name.startswith('-') != backwards else 'gt'
+                   for name in self.ordering]
+        condition = Q()
+        for index, lookup in enumerate(lookups):
+            equal = {
+                field.name: value for field, value
+                in zip(self.fields[:index], values[:index])
+            }
+            equal[f'{self.fields[index].name}__{lookup}'] = values[index]
+            condition |= Q(**equal)
+        bound = Q(**{f'{self.fields[0].name}__{lookups[0]}e': values[0]})
+        return bound & condition
+
+    def get_page(self, token):
+        """Возвращает страницу по токену, для некорректного - первую"""
+        position = self.decode_cursor(token)
+        backwards = position is not None and position[1]
+        ordering = self.ordering
+        if backwards:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}'
+                        for name in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(*position))
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if position is not None and not objects:
+            return self.get_page(None)
+        if backwards:
+            objects.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        return CursorPage(
+            objects,
+            self.encode_cursor(objects[-1]) if has_next else None,
+            self.encode_cursor(objects[0], True) if has_previous else None,
+        )
+
+
+def paginate_queryset(request, queryset, per_page, ordering=CURSOR_ORDERING,
+                      count_key=None):
+    """Разбивает полученный queryset на страницы
+    Если в запросе есть параметр cursor, использует курсорную пагинацию.
+    Номера страниц глубже MAX_PAGE_NUMBER ведут на последнюю доступную
+    страницу, а с неё ссылка next_cursor продолжает ленту курсором.
+    """
+    cursor_paginator = CursorPaginator(queryset, per_page, ordering)
+    if 'cursor' in request.GET:
+        return cursor_paginator.get_page(request.GET['cursor'])
+    paginator = CachedCountPaginator(queryset.order_by(*ordering), per_page,
+                                     count_key)
+    page = paginator.get_page(request.GET.get('page'))
+    page.page_window = paginator.page_window(page.number)
+    page.next_cursor = None
+    if paginator.has_more_pages and not page.has_next():
+        page.next_cursor = cursor_paginator.encode_cursor(page[-1])
+    return page
+
+
+def page_cache_path(request):
+    """Путь страницы для ключей кэша с одним параметром пагинации
+
+    Остальные параметры не меняют ответ и не должны плодить ключи. Номер
+    страницы приводится к той странице, которую отдаст paginate_queryset:
+    не число - первая, меньше единицы - последняя (0), глубже
+    MAX_PAGE_NUMBER - MAX_PAGE_NUMBER.
+    """
+    if 'cursor' in request.GET:
+        return f'{request.path}?cursor={request.GET["cursor"]}'
+    try:
+        number = int(request.GET.get('page', 1))
+    except (TypeError, ValueError):
+        number = 1
+    return f'{request.path}?page={min(max(number, 0), MAX_PAGE_NUMBER)}'
+
+
+def page_version_scopes(url_name, kwargs, user_id=None):
+    """Области версий, от которых зависит содержимое страницы"""
+    scopes = {
+        'index': ['posts'],
+        'group_posts': ['posts'],
+        'profile': ['posts', 'follows'],
+        'post_detail': ['posts', f'post:{kwargs.get("post_id")}'],
+        'follow_index': ['posts', f'user:{user_id}'],
+    }
+    return scopes.get(url_name)
+
+
+def latest_pub_date(queryset):
+    """Дата самого нового поста выборки, один запрос по индексу"""
+    return [queryset.order_by('-pub_date').values_list(
+        'pub_date', flat=True).first()]
+
+
+def conditional_page(state):
+    """Условный GET для страницы ленты или поста
+
+    state(request, **kwargs) дёшево, без рендеринга, возвращает список
+    значений, от которых зависит страница. ETag строится из него,
+    версий областей страницы и пользователя; при совпадении
+    представление не выполняется и клиент получает 304.
 
+    Last-Modified не отдаётся: правки, удаления, комментарии и подписки
+    не двигают ни одну дату страницы, и If-Modified-Since возвращал бы
+    304 с устаревшим содержимым.
+    """
+    def etag(request, *args, **kwargs):
+        values = state(request, *args, **kwargs)
+        scopes = page_version_scopes(
+            request.resolver_match.url_name, kwargs, request.user.pk)
+        raw = json.dumps([values, get_versions(scopes or []),
+                          request.user.pk], default=str)
+        return hashlib.md5(raw.encode()).hexdigest()
 
-def paginate_queryset(request, queryset, per_page):
-    """Разбивает полученный queryset на страницы"""
-    paginator = Paginator(queryset, per_page)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    return condition(etag_func=etag)
 
 
 def check_urls_status(object, client, urls):
@@ -1,34 +1,77 @@
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 
+from .autocomplete import autocomplete_index
+from .feed import FEED_ORDERING, feed_queryset
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import paginate_queryset
+from .models import Comment, FeedItem, Follow, Group, Post, User
+from .search import search_posts
+from .thumbnails import enqueue_thumbnails
+from .utils import (CursorPaginator, conditional_page, latest_pub_date,
+                    paginate_queryset)
 
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+COMMENTS_ORDERING = ('-created', '-id')
 
 
+def index_posts():
+    """Посты главной страницы"""
+    return Post.objects.select_related('author').select_related('group').all()
+
+
+def group_feed(slug):
+    """Посты сообщества"""
+    return Post.objects.select_related('author').filter(group__slug=slug)
+
+
+def profile_feed(username):
+    """Посты пользователя"""
+    return Post.objects.select_related('group').filter(
+        author__username=username)
+
+
+def post_state(post_id):
+    """Дата изменения и число комментариев поста"""
+    return list(Post.objects.filter(pk=post_id).values_list(
+        'updated', 'comments_count').first() or [])
+
+
+def comments_page(post_id, cursor=None):
+    """Порция комментариев поста вместе с авторами"""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author')
+    paginator = CursorPaginator(comments, COMMENTS_ON_PAGE,
+                                COMMENTS_ORDERING)
+    return paginator.get_page(cursor)
+
+
+@conditional_page(lambda request: latest_pub_date(index_posts()))
 def index(request):
     """Возвращает главную страницу приложения"""
     template = "posts/index.html"
-    posts = Post.objects.select_related('author').select_related('group').all()
-    page_obj = paginate_queryset(request, posts, POSTS_ON_PAGE)
+    posts = index_posts()
+    page_obj = paginate_queryset(request, posts, POSTS_ON_PAGE,
+                                 count_key='posts')
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@conditional_page(lambda request, slug: latest_pub_date(group_feed(slug)))
 def group_posts(request, slug):
     """Принимает slug группы
     Возвращает страницу этого сообщества с последними ссобщениями
     """
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author').all()
-    page_obj = paginate_queryset(request, posts, POSTS_ON_PAGE)
+    posts = group_feed(slug)
+    page_obj = paginate_queryset(request, posts, POSTS_ON_PAGE,
+                                 count_key=f'group:{group.pk}')
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -36,19 +79,21 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@conditional_page(
+    lambda request, username: latest_pub_date(profile_feed(username)))
 def profile(request, username):
     """Принимает username пользователя
     Возвращает страницу-профиль этого пользователя
     """
+    user_object = get_object_or_404(User.objects.select_related('stats'),
+                                    username=username)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=request.user,
-                                          author=User.objects.get
-                                          (username=username)).exists()
-    user_object = get_object_or_404(User, username=username)
-    user_posts = user_object.posts.select_related(
-        'group').all().annotate(posts_count=Count('id'))
-    page_obj = paginate_queryset(request, user_posts, POSTS_ON_PAGE)
+                                          author=user_object).exists()
+    user_posts = profile_feed(username)
+    page_obj = paginate_queryset(request, user_posts, POSTS_ON_PAGE,
+                                 count_key=f'author:{user_object.pk}')
     context = {
         'user_object': user_object,
         'page_obj': page_obj,
@@ -57,19 +102,20 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(lambda request, post_id: post_state(post_id))
 def post_detail(request, post_id):
     """Принимает post_id поста
     Возвращает страницу с деталями этого поста
     """
     post_object = get_object_or_404(Post.objects.select_related(
-        'author').select_related('group'), id=post_id)
+        'author__stats').select_related('group'), id=post_id)
     is_author = False
     if request.user == post_object.author:
         is_author = True
     form = CommentForm(
         request.POST or None,
     )
-    comments = post_object.comments.all()
+    comments = SimpleLazyObject(lambda: comments_page(post_object.id))
     context = {
         'post_object': post_object,
         'is_author': is_author,
@@ -79,6 +125,40 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Возвращает HTML-фрагмент со следующей порцией комментариев"""
+    post_object = get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {
+        'post_object': post_object,
+        'comments': comments_page(post_id, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/includes/view_comments.html', context)
+
+
+def search(request):
+    """Полнотекстовый поиск по постам"""
+    query = request.GET.get('q', '').strip()
+    page_obj = search_posts(query, request.GET.get('cursor'), POSTS_ON_PAGE)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def autocomplete(request):
+    """Подсказки пользователей и сообществ по началу или части имени"""
+    results = []
+    for entry in autocomplete_index.search(request.GET.get('q', '')):
+        if entry.kind == 'user':
+            url = reverse('posts:profile', kwargs={'username': entry.key})
+        else:
+            url = reverse('posts:group_posts', kwargs={'slug': entry.key})
+        results.append({'type': entry.kind, 'label': entry.label,
+                        'url': url})
+    return JsonResponse({'results': results})
+
+
 @login_required
 def post_create(request):
     """Создание нового поста"""
@@ -95,6 +175,7 @@ def post_create(request):
             new_post = form.save(commit=False)
             new_post.author = request.user
             new_post.save()
+            enqueue_thumbnails(new_post)
             return redirect(reverse('posts:profile',
                             kwargs={'username': request.user.username}))
 
@@ -124,6 +205,8 @@ def post_edit(request, post_id):
                 post_object.text = form.cleaned_data['text']
                 post_object.group = form.cleaned_data['group']
                 post_object.save()
+                if 'image' in form.changed_data:
+                    enqueue_thumbnails(post_object)
                 return redirect(reverse('posts:post_detail',
                                 kwargs={'post_id': post_object.id}))
 
@@ -150,14 +233,15 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional_page(lambda request: latest_pub_date(
+    FeedItem.objects.filter(user=request.user)))
 def follow_index(request):
     """Возвращает страницу постов любимых авторов"""
-    user_object = request.user
-    authors = user_object.follower.all().values_list('author', flat=True)
-    posts = Post.objects.select_related('author').select_related(
-        'group').filter(author__id__in=authors)
+    feed_items = feed_queryset(request.user)
     template = "posts/follow.html"
-    page_obj = paginate_queryset(request, posts, POSTS_ON_PAGE)
+    page_obj = paginate_queryset(request, feed_items, POSTS_ON_PAGE,
+                                 FEED_ORDERING, f'feed:{request.user.pk}')
+    page_obj.object_list = [item.post for item in page_obj]
     context = {
         'page_obj': page_obj,
     }
@@ -39,6 +39,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryInstrumentationMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -130,7 +133,17 @@ LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма ставятся в очередь задач, а отправляет их EMAIL_DELIVERY_BACKEND
+# из manage.py send_queued_mail пачками по EMAIL_BATCH_SIZE. Для проверки
+# по SMTP подойдёт локальный отладочный сервер на EMAIL_HOST:EMAIL_PORT
+# и бэкенд django.core.mail.backends.smtp.EmailBackend.
+EMAIL_BACKEND = 'core.mail.QueuedEmailBackend'
+
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+
+EMAIL_BATCH_SIZE = 50
+
+EMAIL_PRIORITY = 10
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
@@ -141,3 +154,97 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, раскладываются по лентам очередью задач пачками.
+# Без воркера manage.py run_jobs они не появятся ни в одной ленте.
+FEED_FANOUT_LIMIT = 1000
+
+FEED_BACKFILL_LIMIT = 100
+
+# Кэш целых страниц для анонимных читателей: на сервере до изменения
+# данных, в браузере и прокси - PAGE_CACHE_MAX_AGE секунд.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+PAGE_CACHE_MAX_AGE = 60
+
+# Миниатюры изображений постов: размеры для шаблонов и фоновой генерации
+# при загрузке в очереди задач (manage.py run_jobs) с приоритетом
+# THUMBNAIL_PRIORITY. При THUMBNAIL_QUEUE = False миниатюры создаются
+# в запросе.
+# Недостающая миниатюра ставится в очередь из страницы не чаще раза в
+# THUMBNAIL_RETRY_TIMEOUT секунд, неудачная генерация тоже ждёт столько.
+POST_IMAGE_GEOMETRIES = {
+    'card': ('1200x300', {'crop': 'center', 'upscale': True}),
+}
+
+THUMBNAIL_QUEUE = True
+
+THUMBNAIL_PRIORITY = 5
+
+THUMBNAIL_PENDING_TIMEOUT = 60 * 5
+
+THUMBNAIL_RETRY_TIMEOUT = 60 * 60
+
+# Адаптивные варианты изображений постов для srcset: ширины и форматы,
+# AVIF только если его поддерживает установленный Pillow.
+POST_IMAGE_WIDTHS = (400, 800, 1200)
+
+POST_IMAGE_FORMATS = ('avif', 'webp')
+
+POST_IMAGE_QUALITY = 80
+
+POST_IMAGE_SIZES = '(min-width: 1200px) 1110px, 100vw'
+
+# Нормализация загрузок: изображения больше POST_IMAGE_MAX_PIXELS
+# отклоняются по заголовку, остальные уменьшаются до POST_IMAGE_MAX_EDGE
+# по большей стороне и пересохраняются без EXIF.
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+
+POST_IMAGE_MAX_EDGE = 2560
+
+POST_IMAGE_UPLOAD_QUALITY = 90
+
+# Очередь отложенных задач в БД (core.jobs, manage.py run_jobs):
+# взятая воркером задача скрыта от других JOB_VISIBILITY_TIMEOUT секунд,
+# упавшая повторяется через JOB_RETRY_DELAY * 2^(попытка - 1) секунд,
+# но не реже JOB_RETRY_DELAY_MAX.
+JOB_WORKERS = 4
+
+JOB_POLL_INTERVAL = 1
+
+JOB_VISIBILITY_TIMEOUT = 60 * 5
+
+JOB_MAX_ATTEMPTS = 5
+
+JOB_RETRY_DELAY = 10
+
+JOB_RETRY_DELAY_MAX = 60 * 60
+
+# Статистика запросов к БД (core.middleware): доля запросов, для которых
+# она собирается, порог повторов одного SQL, после которого он считается
+# N+1, и заголовок X-Query-Stats в ответе.
+QUERY_SAMPLE_RATE = 0.01
+
+QUERY_N_PLUS_ONE_THRESHOLD = 5
+
+QUERY_STATS_HEADER = False
+
+# Метрики для /metrics (core.metrics). При нескольких процессах-воркерах
+# задайте METRICS_DIR: каждый процесс выгружает туда свои значения не реже
+# METRICS_FLUSH_INTERVAL секунд, а /metrics их суммирует. Каталог нужно
+# очищать при перезапуске приложения.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+METRICS_FLUSH_INTERVAL = 1
+
+METRICS_NAMESPACES = ('posts', 'users', 'about')
+
+# /metrics отвечает только адресам из METRICS_ALLOWED_IPS (REMOTE_ADDR,
+# за прокси это адрес прокси) и запросам с заголовком
+# Authorization: Bearer <METRICS_TOKEN>. По умолчанию закрыт для всех.
+METRICS_ALLOWED_IPS = [
+    address for address in os.environ.get(
+        'METRICS_ALLOWED_IPS', '').split(',') if address]
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')